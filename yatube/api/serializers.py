@@ -0,0 +1,101 @@
+"""Компактная сериализация строк values() в ответы API.
+
+Для каждого ресурса описано, какие поля он отдаёт и из каких
+lookup'ов они берутся. Клиент выбирает нужные поля параметром
+?fields=, и из базы читаются только они, без создания объектов
+моделей.
+"""
+from posts.storage import post_image_storage
+
+
+class FieldsError(ValueError):
+    pass
+
+
+def image_url(name):
+    return post_image_storage.url(name) if name else None
+
+
+class Resource:
+    def __init__(self, fields, default=None, transforms=None, internal=()):
+        # Публичное имя поля -> lookup для values().
+        self.fields = fields
+        self.default = tuple(default or fields)
+        self.transforms = transforms or {}
+        # Поля, которые нужны пагинатору, даже если клиент их не просил.
+        self.internal = internal
+
+    def requested(self, request):
+        """Поля из ?fields=, по умолчанию — default."""
+        raw = request.GET.get('fields')
+        if not raw:
+            return self.default
+        names = tuple(name.strip() for name in raw.split(',') if name.strip())
+        unknown = [name for name in names if name not in self.fields]
+        if unknown or not names:
+            raise FieldsError('Неизвестные поля: {}. Доступны: {}.'.format(
+                ', '.join(unknown), ', '.join(self.fields)))
+        return names
+
+    def lookups(self, names):
+        """Аргументы values() для выбранных полей."""
+        lookups = {self.fields[name] for name in names}
+        lookups.update(self.internal)
+        return sorted(lookups)
+
+    def dump(self, row, names):
+        data = {}
+        for name in names:
+            value = row[self.fields[name]]
+            transform = self.transforms.get(name)
+            data[name] = transform(value) if transform else value
+        return data
+
+
+POST = Resource(
+    fields={
+        'id': 'id',
+        'text': 'text',
+        'pub_date': 'pub_date',
+        'modified': 'modified',
+        'author': 'author__username',
+        'group': 'group__slug',
+        'image': 'image',
+        'image_width': 'image_width',
+        'image_height': 'image_height',
+        'comment_count': 'comment_count',
+    },
+    transforms={'image': image_url},
+    internal=('id', 'pub_date'),
+)
+
+COMMENT = Resource(
+    fields={
+        'id': 'id',
+        'post': 'post_id',
+        'author': 'author__username',
+        'text': 'text',
+        'created': 'created',
+    },
+    internal=('id', 'created'),
+)
+
+GROUP = Resource(
+    fields={
+        'slug': 'slug',
+        'title': 'title',
+        'description': 'description',
+    },
+)
+
+PROFILE = Resource(
+    fields={
+        'username': 'username',
+        'first_name': 'first_name',
+        'last_name': 'last_name',
+        'post_count': 'counters__post_count',
+        'follower_count': 'counters__follower_count',
+        'following_count': 'counters__following_count',
+    },
+    internal=('id',),
+)
@@ -0,0 +1,120 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.cache import hole_marker
+from core.testing import run_on_commit
+from posts.models import Comment, Group, Post
+
+User = get_user_model()
+
+
+@override_settings(PAGE_SIZE=2)
+class ApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        with run_on_commit():
+            self.author = User.objects.create_user(username='author')
+            self.group = Group.objects.create(title='Группа', slug='group',
+                                              description='Описание')
+            self.posts = [
+                Post.objects.create(text=f'Пост {i}', author=self.author,
+                                    group=self.group)
+                for i in range(5)
+            ]
+            Comment.objects.create(post=self.posts[0], author=self.author,
+                                   text='Комментарий')
+
+    def collect(self, url, **params):
+        """id всех постов, пройденных по ссылкам next."""
+        seen = []
+        response = self.client.get(url, params)
+        while True:
+            data = response.json()
+            seen.extend(item['id'] for item in data['results'])
+            if data['next'] is None:
+                return seen
+            response = self.client.get(data['next'])
+
+    def test_feeds_follow_cursor_into_archive(self):
+        old = self.posts[:2]
+        Post.objects.filter(pk__in=[post.pk for post in old]).update(
+            pub_date=timezone.now() - timedelta(days=400))
+        call_command('archive_posts', stdout=StringIO())
+        expected = [post.pk for post in reversed(self.posts)]
+        for url in (reverse('api:profile_post_list', args=('author',)),
+                    reverse('api:group_post_list', args=('group',))):
+            with self.subTest(url=url):
+                self.assertEqual(self.collect(url, fields='id'), expected)
+        self.assertEqual(self.collect(reverse('api:post_list')),
+                         expected[:3])
+        response = self.client.get(
+            reverse('api:comment_list', args=(old[0].pk,)))
+        self.assertEqual(response.json()['results'][0]['text'],
+                         'Комментарий')
+
+    def test_sparse_fields_select_only_requested_columns(self):
+        url = reverse('api:post_detail', args=(self.posts[0].pk,))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'fields': 'id,author'})
+        self.assertEqual(response.json(),
+                         {'id': self.posts[0].pk, 'author': 'author'})
+        self.assertFalse(any('"text"' in query['sql']
+                             for query in queries.captured_queries))
+        response = self.client.get(url, {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['error'])
+
+    def test_responses_are_cached_until_data_changes(self):
+        url = reverse('api:post_list')
+        first = self.client.get(url).json()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).json(), first)
+        with run_on_commit():
+            Post.objects.create(text='Новый', author=self.author)
+        self.assertEqual(self.client.get(url).json()['results'][0]['text'],
+                         'Новый')
+
+    @override_settings(PAGE_SIZE=3)
+    def test_hole_markers_in_post_text_stay_text(self):
+        """Текст поста в виде метки {% hole %} не заполняется."""
+        forged = hole_marker('includes/header.html', {}).rsplit(':', 1)[0]
+        texts = [forged + '-->', '<!--hole:AAAA-->',
+                 '<!--hole:AAAA:0123abcd-->']
+        with run_on_commit():
+            for text in texts:
+                Post.objects.create(text=text, author=self.author)
+        self.client.force_login(self.author)
+        url = reverse('api:post_list')
+        for attempt in ('промах', 'кеш'):
+            with self.subTest(attempt=attempt):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    {item['text'] for item in response.json()['results']},
+                    set(texts))
+
+    def test_profile_and_missing_objects(self):
+        response = self.client.get(
+            reverse('api:profile_detail', args=('author',)),
+            {'fields': 'username,post_count'})
+        self.assertEqual(response.json(),
+                         {'username': 'author', 'post_count': 5})
+        for url in (reverse('api:post_detail', args=(999,)),
+                    reverse('api:profile_detail', args=('nobody',)),
+                    reverse('api:group_post_list', args=('nothing',))):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual(response['Content-Type'],
+                                 'application/json')
+        self.assertEqual(
+            self.client.post(reverse('api:post_list')).status_code, 405)
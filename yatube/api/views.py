@@ -0,0 +1,166 @@
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import condition, require_safe
+
+from core.cache import generation_cache_page, generation_etag
+from core.replicas import read_replica
+from core.utils import CursorPaginator
+from posts import archive, counters, generations
+from posts.models import Group, Post
+
+from .serializers import COMMENT, GROUP, POST, PROFILE, FieldsError
+
+User = get_user_model()
+
+
+def respond(data, status=200):
+    return JsonResponse(data, status=status,
+                        json_dumps_params={'ensure_ascii': False})
+
+
+def api_view(view_func):
+    """Только чтение, ошибки отдаются в JSON, а не страницами сайта."""
+    @require_safe
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view_func(request, *args, **kwargs)
+        except FieldsError as error:
+            return respond({'error': str(error)}, status=400)
+        except Http404:
+            return respond({'error': 'Не найдено.'}, status=404)
+    return wrapper
+
+
+def page_link(request, cursor):
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return f'{request.path}?{params.urlencode()}'
+
+
+def cursor_page(request, sources, resource, field='pub_date', tiered=True):
+    """Страница ресурса по курсору из ?cursor= с полями из ?fields=."""
+    names = resource.requested(request)
+    lookups = resource.lookups(names)
+    page = CursorPaginator(
+        [source.values(*lookups) for source in sources],
+        settings.PAGE_SIZE, field=field, tiered=tiered,
+    ).get_page(request.GET.get('cursor'))
+    return respond({
+        'results': [resource.dump(row, names) for row in page],
+        'next': page_link(request, page.next_cursor()),
+        'previous': page_link(request, page.previous_cursor()),
+    })
+
+
+def one(request, queryset, resource):
+    names = resource.requested(request)
+    row = queryset.values(*resource.lookups(names)).first()
+    if row is None:
+        raise Http404
+    return row, names
+
+
+def pk_or_404(queryset):
+    pk = queryset.values_list('pk', flat=True).first()
+    if pk is None:
+        raise Http404
+    return pk
+
+
+@read_replica
+@api_view
+@generation_cache_page(settings.PAGE_CACHE_TIMEOUT,
+                       generations.index_scopes)
+def post_list(request):
+    # Как и главная страница, лента всех постов — только горячие посты.
+    return cursor_page(request, [Post.objects.all()], POST)
+
+
+@read_replica
+@api_view
+@condition(etag_func=generation_etag(generations.post_page_scopes))
+@generation_cache_page(settings.PAGE_CACHE_TIMEOUT,
+                       generations.post_page_scopes)
+def post_detail(request, post_id):
+    names = POST.requested(request)
+    for source in archive.post_sources(pk=post_id):
+        row = source.values(*POST.lookups(names)).first()
+        if row is not None:
+            return respond(POST.dump(row, names))
+    raise Http404
+
+
+@read_replica
+@api_view
+@condition(etag_func=generation_etag(generations.post_page_scopes))
+@generation_cache_page(settings.PAGE_CACHE_TIMEOUT,
+                       generations.post_page_scopes)
+def comment_list(request, post_id):
+    return cursor_page(request, [archive.comments_of(post_id)], COMMENT,
+                       field='created', tiered=False)
+
+
+@read_replica
+@api_view
+@generation_cache_page(settings.PAGE_CACHE_TIMEOUT,
+                       generations.group_list_scopes)
+def group_list(request):
+    names = GROUP.requested(request)
+    rows = Group.objects.order_by('title').values(*GROUP.lookups(names))
+    return respond({'results': [GROUP.dump(row, names) for row in rows]})
+
+
+@read_replica
+@api_view
+@condition(etag_func=generation_etag(generations.group_page_scopes))
+@generation_cache_page(settings.PAGE_CACHE_TIMEOUT,
+                       generations.group_page_scopes)
+def group_detail(request, slug):
+    row, names = one(request, Group.objects.filter(slug=slug), GROUP)
+    return respond(GROUP.dump(row, names))
+
+
+@read_replica
+@api_view
+@condition(etag_func=generation_etag(generations.group_page_scopes))
+@generation_cache_page(settings.PAGE_CACHE_TIMEOUT,
+                       generations.group_page_scopes)
+def group_post_list(request, slug):
+    group_id = pk_or_404(Group.objects.filter(slug=slug))
+    return cursor_page(request, archive.post_sources(group_id=group_id),
+                       POST)
+
+
+@read_replica
+@api_view
+@condition(etag_func=generation_etag(generations.profile_page_scopes))
+@generation_cache_page(settings.PAGE_CACHE_TIMEOUT,
+                       generations.profile_page_scopes)
+def profile_detail(request, username):
+    row, names = one(request, User.objects.filter(username=username),
+                     PROFILE)
+    missing = [key for key, value in row.items()
+               if key.startswith('counters__') and value is None]
+    if missing:
+        # Строки счётчиков ещё нет: создаём её, как counters.for_user.
+        user_counters = counters.recompute(row['id'])
+        for key in missing:
+            row[key] = getattr(user_counters, key[len('counters__'):])
+    return respond(PROFILE.dump(row, names))
+
+
+@read_replica
+@api_view
+@condition(etag_func=generation_etag(generations.profile_page_scopes))
+@generation_cache_page(settings.PAGE_CACHE_TIMEOUT,
+                       generations.profile_page_scopes)
+def profile_post_list(request, username):
+    author_id = pk_or_404(User.objects.filter(username=username))
+    return cursor_page(request, archive.post_sources(author_id=author_id),
+                       POST)
@@ -0,0 +1,62 @@
+"""SQLite, настроенный на одновременные чтение и запись.
+
+В режиме WAL читатели не ждут пишущих и наоборот. Прагмы из
+OPTIONS['pragmas'] дополняют DEFAULT_PRAGMAS и выполняются один раз
+на новое соединение; с CONN_MAX_AGE соединение переживает запрос,
+и эта работа не повторяется.
+
+atomic() начинает транзакцию с BEGIN IMMEDIATE (OPTIONS['transaction_mode']):
+при обычном BEGIN транзакция, которая сначала читает, а потом пишет,
+получает «database is locked» сразу, не дожидаясь busy_timeout.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'wal',
+    # В WAL NORMAL не теряет целостность, а fsync делается
+    # только на контрольных точках.
+    'synchronous': 'normal',
+    # Отрицательное значение — размер в КиБ, а не в страницах.
+    'cache_size': -20000,
+    'mmap_size': 128 * 1024 * 1024,
+    'busy_timeout': 5000,
+}
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+# Прагмы, которые не имеют смысла для базы в памяти.
+FILE_ONLY_PRAGMAS = ('journal_mode', 'mmap_size')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # Это не параметры sqlite3.connect().
+        params.pop('pragmas', None)
+        params.pop('transaction_mode', None)
+        return params
+
+    @property
+    def transaction_mode(self):
+        mode = self.settings_dict['OPTIONS'].get(
+            'transaction_mode', 'IMMEDIATE').upper()
+        if mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f'transaction_mode должен быть одним из {TRANSACTION_MODES}')
+        return mode
+
+    def pragmas(self):
+        pragmas = dict(DEFAULT_PRAGMAS)
+        pragmas.update(self.settings_dict['OPTIONS'].get('pragmas', {}))
+        if self.is_in_memory_db():
+            for name in FILE_ONLY_PRAGMAS:
+                pragmas.pop(name, None)
+        return pragmas
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas().items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
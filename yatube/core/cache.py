@@ -0,0 +1,202 @@
+"""Кеширование страниц по поколениям.
+
+Каждая область данных (все посты, группа, автор) имеет счётчик-поколение.
+Номер поколения входит в ключ кеша страницы, поэтому при изменении
+данных достаточно увеличить счётчик: старые страницы перестают
+находиться и со временем вытесняются сами, а неизменные страницы
+могут жить в кеше часами.
+"""
+import base64
+import hashlib
+import json
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from .replicas import on_primary
+
+GENERATION_PREFIX = 'generation:'
+HOLE_RE = re.compile(r'<!--hole:([A-Za-z0-9_=-]+):([0-9a-f]+)-->')
+HOLE_SALT = 'core.cache.hole'
+
+
+def _initial_generation():
+    # Если ключ поколения вытеснен из кеша, новое значение не должно
+    # совпасть ни с одним из прежних, иначе всплывут устаревшие страницы.
+    return int(time.time() * 1000)
+
+
+def _generation_timeout():
+    # В кеше отдельного процесса поколение не видит изменений из других
+    # процессов, поэтому оно истекает, и страницы и ETag обновляются.
+    return None if settings.SHARED_CACHE else settings.LOCAL_CACHE_TIMEOUT
+
+
+def _key(scope):
+    # Имена областей содержат slug и username, которые могут быть
+    # не ASCII, поэтому в ключ идёт их хеш.
+    return GENERATION_PREFIX + hashlib.md5(scope.encode()).hexdigest()
+
+
+def generations(*scopes):
+    """Текущие номера поколений для областей scopes."""
+    keys = [_key(scope) for scope in scopes]
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            cache.add(key, _initial_generation(), _generation_timeout())
+            values[key] = cache.get(key)
+    return [values[key] for key in keys]
+
+
+def bump(*scopes):
+    """Начинает новое поколение для каждой из областей scopes."""
+    for scope in set(scopes):
+        key = _key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial_generation(), _generation_timeout())
+
+
+def bump_on_commit(*scopes):
+    """bump, отложенный до фиксации текущей транзакции.
+
+    Иначе параллельный запрос успел бы положить в кеш под новым
+    поколением ещё не зафиксированные данные, а откат записи всё равно
+    сбросил бы кеш.
+    """
+    def callback():
+        bump(*scopes)
+    callback.scopes = scopes
+    transaction.on_commit(callback)
+
+
+def pending_scopes():
+    """Области, которые сменит поколение после фиксации транзакции.
+
+    Пока транзакция открыта, только её соединение видит новые данные,
+    и страницы этих областей оно рисует мимо кеша.
+    """
+    connection = transaction.get_connection()
+    return {scope for _, callback in connection.run_on_commit
+            for scope in getattr(callback, 'scopes', ())}
+
+
+def _sign(payload):
+    return salted_hmac(HOLE_SALT, payload).hexdigest()
+
+
+def hole_marker(template_name, params):
+    """Метка на месте пользовательского фрагмента в общей странице.
+
+    Метка подписана: такую же строку в тексте поста или в JSON нельзя
+    выдать за фрагмент.
+    """
+    raw = json.dumps([template_name, params]).encode()
+    payload = base64.urlsafe_b64encode(raw).decode()
+    return '<!--hole:{}:{}-->'.format(payload, _sign(payload))
+
+
+def fill_holes(request, html):
+    """Подставляет в общую страницу фрагменты текущего пользователя.
+
+    Метки с неверной подписью остаются в странице как есть.
+    """
+    def render_hole(match):
+        payload, signature = match.groups()
+        if not constant_time_compare(signature, _sign(payload)):
+            return match.group(0)
+        template_name, params = json.loads(base64.urlsafe_b64decode(payload))
+        return render_to_string(template_name, params, request=request)
+    return HOLE_RE.sub(render_hole, html)
+
+
+def _fill(request, content_type, html):
+    # Метки выводит только тег {% hole %} в HTML-шаблонах.
+    if not content_type.startswith('text/html'):
+        return html
+    return fill_holes(request, html)
+
+
+def generation_cache_page(timeout, scopes):
+    """Двухуровневый кеш страницы, ключ которого зависит от поколений.
+
+    Страница рисуется один раз для всех посетителей: пользовательские
+    части, отмеченные тегом {% hole %}, попадают в кеш метками и
+    заполняются при каждом запросе. Поэтому один и тот же кеш
+    обслуживает и анонимных, и залогиненных пользователей.
+
+    scopes принимает аргументы view и возвращает имена областей,
+    от которых зависит страница, или None, если кешировать нечего.
+    Изменения областей, ожидающие фиксации (bump_on_commit), страница
+    видит сразу: такие запросы идут мимо кеша.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+            names = scopes(*args, **kwargs)
+            if names is None:
+                return view_func(request, *args, **kwargs)
+            if pending_scopes().intersection(names):
+                with on_primary():
+                    return view_func(request, *args, **kwargs)
+            current = generations(*names)
+            # v2: метки дыр подписаны, старые страницы не подходят.
+            key = 'page:v2:{}:{}:{}'.format(
+                view_func.__name__, '.'.join(map(str, current)),
+                hashlib.md5(request.get_full_path().encode()).hexdigest())
+            cached = cache.get(key)
+            if cached is not None:
+                content_type, html = cached
+                return HttpResponse(_fill(request, content_type, html),
+                                    content_type=content_type)
+            # Страница ляжет в кеш под текущим поколением, поэтому
+            # рисуется с основной базы: реплика может ещё не догнать
+            # запись, которая это поколение начала.
+            request.shared_render = True
+            try:
+                with on_primary():
+                    response = view_func(request, *args, **kwargs)
+            finally:
+                request.shared_render = False
+            if response.streaming:
+                return response
+            html = response.content.decode(response.charset)
+            if response.status_code == 200:
+                cache.set(key, (response['Content-Type'], html), timeout)
+            response.content = _fill(request, response['Content-Type'], html)
+            return response
+        return wrapper
+    return decorator
+
+
+def generation_etag(scopes):
+    """etag_func для декоратора condition() на основе поколений.
+
+    Валидатор не требует запросов к базе: он меняется вместе
+    с поколениями областей страницы, а также зависит от посетителя,
+    потому что в страницу подставляются его фрагменты.
+    scopes может вернуть None, тогда ETag не выставляется; его нет
+    и у страниц с ещё не зафиксированными изменениями.
+    """
+    def etag_func(request, *args, **kwargs):
+        names = scopes(*args, **kwargs)
+        if names is None or pending_scopes().intersection(names):
+            return None
+        raw = '{}|{}|{}'.format(
+            '.'.join(map(str, generations(*names))),
+            request.user.pk or '',
+            request.get_full_path(),
+        )
+        return hashlib.md5(raw.encode()).hexdigest()
+    return etag_func
@@ -0,0 +1,99 @@
+"""Хранилище ключей sorl-thumbnail с пакетными запросами.
+
+Стандартный cached_db читает каждую миниатюру отдельным обращением
+к кешу, а при промахе — отдельным запросом к базе. Здесь get_many
+и set_many обходятся одним get_many/set_many кеша и одним запросом,
+а prefetched() заранее кладёт найденное в память потока, откуда его
+берёт обычный тег {% thumbnail %}. dry_run() позволяет узнать имя
+миниатюры у самого get_thumbnail, ничего не читая и не строя.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.images import deserialize_image_file, serialize_image_file
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+EMPTY_VALUE = cached_db_kvstore.EMPTY_VALUE
+
+_local = threading.local()
+
+
+class KVStore(cached_db_kvstore.KVStore):
+    def get(self, image_file):
+        if getattr(_local, 'dry_run', False):
+            return image_file
+        prefetched = getattr(_local, 'images', None)
+        if prefetched is not None and image_file.key in prefetched:
+            return prefetched[image_file.key]
+        return super().get(image_file)
+
+    def get_many(self, image_files):
+        """Словарь ключ картинки -> ImageFile или None, если её нет."""
+        keys = {add_prefix(image_file.key): image_file.key
+                for image_file in image_files}
+        return {
+            keys[raw_key]: deserialize_image_file(value) if value else None
+            for raw_key, value in self._get_many_raw(list(keys)).items()
+        }
+
+    def set_many(self, image_files):
+        values = {}
+        for image_file in image_files:
+            image_file.set_size()
+            values[add_prefix(image_file.key)] = serialize_image_file(
+                image_file)
+        self._set_many_raw(values)
+
+    @contextmanager
+    def prefetched(self, image_files):
+        """Внутри блока get() отвечает для image_files без обращений."""
+        previous = getattr(_local, 'images', None)
+        _local.images = dict(previous or {}, **self.get_many(image_files))
+        try:
+            yield
+        finally:
+            _local.images = previous
+
+    @contextmanager
+    def dry_run(self):
+        """Внутри блока get() возвращает саму запрошенную картинку.
+
+        get_thumbnail спрашивает хранилище ключей раньше, чем открывает
+        файлы, поэтому сразу отдаёт миниатюру с посчитанным именем.
+        """
+        previous = getattr(_local, 'dry_run', False)
+        _local.dry_run = True
+        try:
+            yield
+        finally:
+            _local.dry_run = previous
+
+    def _get_many_raw(self, keys):
+        if not keys:
+            return {}
+        values = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            found = dict(KVStoreModel.objects.filter(
+                key__in=missing).values_list('key', 'value'))
+            # Отсутствие тоже кешируется, как в cached_db.
+            fetched = {key: found.get(key, EMPTY_VALUE) for key in missing}
+            self.cache.set_many(fetched, settings.THUMBNAIL_CACHE_TIMEOUT)
+            values.update(fetched)
+        return {key: None if value == EMPTY_VALUE else value
+                for key, value in values.items()}
+
+    def _set_many_raw(self, values):
+        # Замена строк целиком: один DELETE и один INSERT вместо UPDATE
+        # на каждый уже записанный ключ.
+        with transaction.atomic():
+            KVStoreModel.objects.filter(key__in=list(values)).delete()
+            KVStoreModel.objects.bulk_create(
+                KVStoreModel(key=key, value=value)
+                for key, value in values.items())
+        self.cache.set_many(values, settings.THUMBNAIL_CACHE_TIMEOUT)
@@ -0,0 +1,140 @@
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from django.test import Client
+from django.urls import reverse
+
+from posts.models import Post
+
+User = get_user_model()
+
+# Стандартный бэкенд с журналом отката и соединением на запрос
+# против бэкенда проекта.
+MODES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'CONN_MAX_AGE': 0,
+    },
+    'tuned': {
+        'ENGINE': 'core.backends.sqlite3',
+        'CONN_MAX_AGE': 60,
+    },
+}
+
+
+class BenchClient(Client):
+    """Клиент, который узнаёт об ошибках только по коду ответа.
+
+    Сигнал got_request_exception общий для всех потоков, и обычный
+    Client поднимал бы в своём потоке чужие исключения.
+    """
+
+    def store_exc_info(self, **kwargs):
+        pass
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность SQLite со стандартными '
+            'настройками и с core.backends.sqlite3 на смеси чтений '
+            'страниц постов и добавления комментариев.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--write-ratio', type=float, default=0.2)
+        parser.add_argument('--posts', type=int, default=200)
+
+    def handle(self, *args, **options):
+        self.options = options
+        # Ошибки подсчитываются в отчёте, их трейсбеки только мешают.
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        with tempfile.TemporaryDirectory() as directory:
+            for mode, engine in MODES.items():
+                connections.close_all()
+                cache.clear()
+                connections.databases['default'] = dict(
+                    engine, NAME=os.path.join(directory, f'{mode}.sqlite3'))
+                # Каждый поток создаёт соединение по новым настройкам,
+                # поэтому база готовится и нагружается в своих потоках.
+                self.in_thread(self.prepare)
+                self.report(mode, self.run())
+
+    def in_thread(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.start()
+        thread.join()
+
+    def prepare(self):
+        call_command('migrate', verbosity=0)
+        author = User.objects.create_user(username='bench_author')
+        self.post_ids = [
+            Post.objects.create(text=f'Пост {i}', author=author).pk
+            for i in range(self.options['posts'])
+        ]
+        self.users = [
+            User.objects.create_user(username=f'bench_{i}')
+            for i in range(self.options['threads'])
+        ]
+        close_old_connections()
+
+    def run(self):
+        deadline = time.monotonic() + self.options['seconds']
+        results = []
+        threads = [
+            threading.Thread(target=self.worker,
+                             args=(user, deadline, results))
+            for user in self.users
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def worker(self, user, deadline, results):
+        client = BenchClient()
+        client.force_login(user)
+        while time.monotonic() < deadline:
+            post_id = random.choice(self.post_ids)
+            started = time.monotonic()
+            if random.random() < self.options['write_ratio']:
+                kind = 'write'
+                response = client.post(
+                    reverse('posts:add_comment', args=(post_id,)),
+                    {'text': 'Комментарий'})
+            else:
+                kind = 'read'
+                response = client.get(
+                    reverse('posts:post_detail', args=(post_id,)))
+            ok = response.status_code < 400
+            # Тестовый клиент не закрывает соединения после запроса,
+            # делаем это так же, как обработчик request_finished.
+            close_old_connections()
+            results.append((kind, ok, time.monotonic() - started))
+        connections.close_all()
+
+    def report(self, mode, results):
+        seconds = self.options['seconds']
+        self.stdout.write(f'{mode}:')
+        for kind in ('read', 'write'):
+            timings = [spent for got, ok, spent in results
+                       if got == kind and ok]
+            failed = sum(1 for got, ok, _ in results if got == kind and not ok)
+            if not timings:
+                self.stdout.write(f'  {kind}: нет успешных запросов, '
+                                  f'ошибок {failed}')
+                continue
+            timings.sort()
+            p95 = timings[int(len(timings) * 0.95)] * 1000
+            self.stdout.write(
+                f'  {kind}: {len(timings) / seconds:.1f} запр/с, '
+                f'p95 {p95:.1f} мс, ошибок {failed}')
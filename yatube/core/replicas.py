@@ -0,0 +1,98 @@
+"""Чтение с реплик базы данных.
+
+View, помеченные read_replica, читают с одной из REPLICA_DATABASES,
+остальной код — с основной базы. После записи через view с pin_primary
+пользователь REPLICA_PIN_SECONDS секунд читает только с основной базы,
+чтобы видеть свои изменения, пока реплики их догоняют. Страницы,
+которые уходят в общий кеш, рисуются с основной базы (on_primary):
+иначе отставшая реплика попала бы в кеш под новым поколением.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+
+PIN_COOKIE = 'pin_primary'
+# Сессии и пользователь нужны сразу после входа, поэтому читаются
+# с основной базы даже во view на репликах.
+PRIMARY_APPS = ('sessions',)
+
+_state = threading.local()
+
+
+def current_replica():
+    return getattr(_state, 'alias', None)
+
+
+def is_pinned(request):
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def read_replica(view_func):
+    """Выполняет view на случайной реплике, если пользователь не закреплён."""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not settings.REPLICA_DATABASES or is_pinned(request):
+            return view_func(request, *args, **kwargs)
+        # Пользователь из сессии загружается заранее, с основной базы.
+        request.user.pk
+        previous = current_replica()
+        _state.alias = random.choice(settings.REPLICA_DATABASES)
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            _state.alias = previous
+    return wrapper
+
+
+@contextmanager
+def on_primary():
+    """Внутри блока чтение идёт с основной базы даже во view на реплике."""
+    previous = current_replica()
+    _state.alias = None
+    try:
+        yield
+    finally:
+        _state.alias = previous
+
+
+def pin_primary(view_func):
+    """Закрепляет пользователя за основной базой после записи.
+
+    Пишущие view после успешной записи делают редирект, по нему
+    и ставится отметка.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        response = view_func(request, *args, **kwargs)
+        if response.status_code == 302:
+            until = time.time() + settings.REPLICA_PIN_SECONDS
+            response.set_cookie(PIN_COOKIE, str(until),
+                                max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True)
+        return response
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_APPS:
+            return 'default'
+        return current_replica()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На всех базах одни и те же данные.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема попадает на реплики вместе с данными.
+        return db not in settings.REPLICA_DATABASES
@@ -0,0 +1,23 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from core.cache import hole_marker
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, template_name, **params):
+    """Пользовательский фрагмент страницы.
+
+    В обычном рендере работает как {% include %}. Когда страница
+    рисуется для общего кеша, вместо фрагмента выводится метка, которую
+    generation_cache_page заполняет отдельно для каждого запроса.
+    Параметры фрагмента должны сериализоваться в JSON.
+    """
+    request = context.get('request')
+    if getattr(request, 'shared_render', False):
+        return mark_safe(hole_marker(template_name, params))
+    fragment = context.template.engine.get_template(template_name)
+    with context.push(**params):
+        return fragment.render(context)
@@ -0,0 +1,21 @@
+"""Помощники для тестов."""
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+@contextmanager
+def run_on_commit(using=DEFAULT_DB_ALIAS):
+    """Выполняет отложенные в блоке on_commit так, будто была фиксация.
+
+    TestCase откатывает транзакцию теста, и без этого действия после
+    фиксации в нём не выполнялись бы вовсе (в Django 3.2 для этого
+    появился captureOnCommitCallbacks).
+    """
+    connection = connections[using]
+    start = len(connection.run_on_commit)
+    yield
+    callbacks = connection.run_on_commit[start:]
+    del connection.run_on_commit[start:]
+    for _, callback in callbacks:
+        callback()
@@ -1,4 +1,26 @@
-from django.test import TestCase
+import os
+import sqlite3
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import connection, router
+from django.http import HttpResponse, HttpResponseRedirect
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.backends.sqlite3.base import DatabaseWrapper
+from core.cache import generation_cache_page
+from core.replicas import PIN_COOKIE, pin_primary, read_replica
+from core.utils import EstimatedCountPaginator
+from posts.models import Post
+
+User = get_user_model()
 
 
 class ViewTestClass(TestCase):
@@ -8,3 +30,152 @@ class ViewTestClass(TestCase):
         self.assertEqual(response.status_code, 404)
         # Проверка, что используется шаблон core/404.html
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+@override_settings(PAGE_SIZE=2, ESTIMATED_COUNT_THRESHOLD=5)
+class EstimatedCountPaginatorTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(username='author')
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=author) for i in range(6))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_small_lists_are_counted_exactly(self):
+        """Выборка меньше порога считается точно."""
+        paginator = EstimatedCountPaginator(Post.objects.all()[:4], 2)
+        self.assertEqual(paginator.count, 4)
+        self.assertFalse(paginator.estimated)
+
+    def test_large_count_is_cached(self):
+        """Большое число строк считается один раз и берётся из кеша."""
+        response = self.client.get(reverse('posts:index'), {'page': 1})
+        self.assertTrue(response.context['page_obj'].paginator.estimated)
+        self.assertContains(response, 'много страниц')
+        with self.assertNumQueries(0):
+            paginator = EstimatedCountPaginator(Post.objects.feed(), 2)
+            self.assertEqual(paginator.count, 6)
+
+    def test_count_from_table_statistics(self):
+        """Без кеша число строк берётся из статистики СУБД."""
+        if connection.vendor != 'sqlite':
+            self.skipTest('Статистика проверяется на SQLite.')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        paginator = EstimatedCountPaginator(Post.objects.all(), 2)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(paginator.count, 6)
+        self.assertTrue(paginator.estimated)
+        self.assertFalse(any('COUNT' in query['sql']
+                             for query in queries.captured_queries))
+
+    def test_pages_past_stale_estimate_are_reachable(self):
+        """Страницы за устаревшей оценкой открываются и листаются."""
+        if connection.vendor != 'sqlite':
+            self.skipTest('Статистика проверяется на SQLite.')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        author = User.objects.get(username='author')
+        Post.objects.bulk_create(
+            Post(text=f'Новый {i}', author=author) for i in range(4))
+        paginator = EstimatedCountPaginator(
+            Post.objects.order_by('pk'), 2)
+        self.assertEqual(paginator.num_pages, 3)
+        page = paginator.get_page(3)
+        self.assertTrue(page.has_next())
+        page = paginator.get_page(page.next_page_number())
+        self.assertEqual([post.text for post in page],
+                         ['Новый 0', 'Новый 1'])
+        page = paginator.get_page(5)
+        self.assertEqual(len(page), 2)
+        self.assertFalse(page.has_next())
+
+
+@read_replica
+def databases_view(request):
+    return HttpResponse(' '.join((
+        router.db_for_read(Post),
+        router.db_for_read(Session),
+        router.db_for_write(Post),
+    )))
+
+
+@read_replica
+@generation_cache_page(60, lambda: ['replica-test'])
+def cached_databases_view(request):
+    return HttpResponse(router.db_for_read(Post))
+
+
+@override_settings(REPLICA_DATABASES=['replica'], REPLICA_PIN_SECONDS=10)
+class ReplicaRouterTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def read(self, **cookies):
+        request = self.factory.get('/')
+        request.user = AnonymousUser()
+        request.COOKIES.update(cookies)
+        return databases_view(request).content.decode()
+
+    def test_read_views_use_replica(self):
+        self.assertEqual(self.read(), 'replica default default')
+        # Вне view чтение идёт с основной базы.
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+    def test_cached_pages_are_rendered_on_primary(self):
+        """Промах кеша рисуется с основной базы, а не с реплики."""
+        cache.clear()
+        request = self.factory.get('/')
+        request.user = AnonymousUser()
+        self.assertEqual(cached_databases_view(request).content, b'default')
+
+    def test_writes_pin_user_to_primary(self):
+        view = pin_primary(lambda request: HttpResponseRedirect('/'))
+        response = view(self.factory.post('/'))
+        pin = response.cookies[PIN_COOKIE]
+        self.assertEqual(pin['max-age'], 10)
+        self.assertEqual(self.read(**{PIN_COOKIE: pin.value}),
+                         'default default default')
+        expired = str(time.time() - 1)
+        self.assertEqual(self.read(**{PIN_COOKIE: expired}),
+                         'replica default default')
+
+    def test_failed_write_does_not_pin(self):
+        view = pin_primary(lambda request: HttpResponse())
+        response = view(self.factory.post('/'))
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+
+class TunedSQLiteBackendTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.wrapper = DatabaseWrapper(dict(
+            connection.settings_dict,
+            NAME=os.path.join(directory.name, 'db.sqlite3'),
+            OPTIONS={'pragmas': {'cache_size': -1000}},
+        ), alias='tuned')
+        self.addCleanup(self.wrapper.close)
+
+    def test_pragmas(self):
+        values = {}
+        with self.wrapper.cursor() as cursor:
+            for name in ('journal_mode', 'synchronous', 'cache_size',
+                         'busy_timeout'):
+                cursor.execute(f'PRAGMA {name}')
+                values[name] = cursor.fetchone()[0]
+        self.assertEqual(values, {'journal_mode': 'wal', 'synchronous': 1,
+                                  'cache_size': -1000, 'busy_timeout': 5000})
+
+    def test_transactions_take_write_lock_at_once(self):
+        self.wrapper.set_autocommit(
+            False, force_begin_transaction_with_broken_autocommit=True)
+        other = sqlite3.connect(self.wrapper.settings_dict['NAME'],
+                                timeout=0)
+        self.addCleanup(other.close)
+        with self.assertRaises(sqlite3.OperationalError):
+            other.execute('BEGIN IMMEDIATE')
+        self.wrapper.rollback()
+        self.wrapper.set_autocommit(True)
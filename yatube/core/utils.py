@@ -1,6 +1,17 @@
+import base64
+import binascii
+import hashlib
+import heapq
+import json
+
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Q, QuerySet
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
 
 
 def year(request):
@@ -10,8 +21,300 @@ def year(request):
     }
 
 
-def paginator(request, posts):
-    paginator = Paginator(posts, settings.PAGE_SIZE)
+def encode_cursor(value, pk, direction):
+    """Упаковывает позицию в ленте в непрозрачную строку для URL."""
+    raw = json.dumps([value.isoformat(), pk, direction])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Распаковывает курсор. Для испорченного курсора возвращает None."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        value, pk, direction = json.loads(raw)
+        value = parse_datetime(value)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        return None
+    if value is None or not isinstance(pk, int) or direction not in (
+            'next', 'prev'):
+        return None
+    return value, pk, direction
+
+
+class CursorPage(Page):
+    """Страница ленты, знающая курсоры соседних страниц."""
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Cursor page of %s items>' % len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        return self.paginator.cursor_for(self.object_list[-1], 'next')
+
+    def previous_cursor(self):
+        if not self._has_previous:
+            return None
+        return self.paginator.cursor_for(self.object_list[0], 'prev')
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор по ключу (field, pk) без COUNT(*) и OFFSET.
+
+    Каждая страница — это один запрос вида
+    WHERE (field, pk) < (курсор) ORDER BY field DESC, pk DESC LIMIT n + 1,
+    который идёт по индексу поля field. Вместо одного queryset можно
+    передать список: страницы каждого источника сливаются k-way слиянием.
+
+    tiered=True означает, что источники не пересекаются по field и идут
+    от новых к старым, как горячая таблица и архив. Тогда следующий
+    источник читается, только если предыдущего не хватило на страницу.
+
+    Источники могут быть и результатами values(): тогда в строках
+    должны быть field и id.
+    """
+    cursor_mode = True
+
+    def __init__(self, object_list, per_page, field='pub_date',
+                 tiered=False):
+        super().__init__(object_list, per_page)
+        self.field = field
+        self.tiered = tiered
+
+    def position(self, obj):
+        if isinstance(obj, dict):
+            return obj[self.field], obj['id']
+        return getattr(obj, self.field), obj.pk
+
+    def cursor_for(self, obj, direction):
+        return encode_cursor(*self.position(obj), direction)
+
+    def get_page(self, cursor):
+        position = decode_cursor(cursor) if cursor else None
+        if position is None:
+            return self._first_page()
+        value, pk, direction = position
+        if direction == 'next':
+            return self._page_after(value, pk)
+        return self._page_before(value, pk)
+
+    def _first_page(self):
+        rows = self._fetch(descending=True)
+        return CursorPage(rows[:self.per_page], self,
+                          has_next=len(rows) > self.per_page,
+                          has_previous=False)
+
+    def _page_after(self, value, pk):
+        field = self.field
+        rows = self._fetch(
+            descending=True,
+            condition=(Q(**{f'{field}__lt': value})
+                       | Q(**{field: value, 'pk__lt': pk})),
+        )
+        # Пустой странице не к чему привязать курсор назад.
+        return CursorPage(rows[:self.per_page], self,
+                          has_next=len(rows) > self.per_page,
+                          has_previous=bool(rows))
+
+    def _page_before(self, value, pk):
+        field = self.field
+        rows = self._fetch(
+            descending=False,
+            condition=(Q(**{f'{field}__gt': value})
+                       | Q(**{field: value, 'pk__gt': pk})),
+        )
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        rows.reverse()
+        return CursorPage(rows, self,
+                          has_next=bool(rows),
+                          has_previous=has_previous)
+
+    def _sources(self):
+        if isinstance(self.object_list, (list, tuple)):
+            return self.object_list
+        return [self.object_list]
+
+    def _ordered(self, source, descending, condition):
+        prefix = '-' if descending else ''
+        queryset = source.order_by(f'{prefix}{self.field}', f'{prefix}pk')
+        if condition is not None:
+            queryset = queryset.filter(condition)
+        return queryset
+
+    def _fetch_tiers(self, descending, condition):
+        limit = self.per_page + 1
+        sources = self._sources()
+        rows = []
+        for source in sources if descending else reversed(sources):
+            queryset = self._ordered(source, descending, condition)
+            rows.extend(queryset[:limit - len(rows)])
+            if len(rows) == limit:
+                break
+        return rows
+
+    def _fetch(self, descending, condition=None):
+        if self.tiered:
+            return self._fetch_tiers(descending, condition)
+        limit = self.per_page + 1
+        chunks = []
+        for source in self._sources():
+            queryset = self._ordered(source, descending, condition)
+            chunks.append(list(queryset[:limit]))
+        if len(chunks) == 1:
+            return chunks[0]
+        merged = heapq.merge(*chunks, key=self.position, reverse=descending)
+        rows, seen = [], set()
+        for obj in merged:
+            _, pk = self.position(obj)
+            if pk not in seen:
+                seen.add(pk)
+                rows.append(obj)
+                if len(rows) == limit:
+                    break
+        return rows
+
+
+class EstimatedPage(Page):
+    """Страница, о следующей странице которой судят по лишней строке."""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор, который не считает COUNT(*) для больших выборок.
+
+    Число строк берётся из кеша или из статистики СУБД; точный COUNT(*)
+    выполняется, только если ни того, ни другого нет, и его результат
+    кешируется на ESTIMATED_COUNT_TIMEOUT секунд. Выборки меньше
+    ESTIMATED_COUNT_THRESHOLD всегда считаются точно.
+
+    Оценка может отставать от таблицы, поэтому с ней номер страницы
+    не ограничивается num_pages, а есть ли следующая страница, решает
+    лишняя строка выборки.
+    """
+    estimated = False
+
+    def validate_number(self, number):
+        if not self.count or not self.estimated:
+            return super().validate_number(number)
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы должен быть целым')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.estimated:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        return EstimatedPage(rows[:self.per_page], number, self,
+                             has_next=len(rows) > self.per_page)
+
+    @cached_property
+    def count(self):
+        key = self._cache_key()
+        count = cache.get(key)
+        if count is None:
+            count = self._table_statistics()
+        if count is None or count < settings.ESTIMATED_COUNT_THRESHOLD:
+            count = super().count
+            if count < settings.ESTIMATED_COUNT_THRESHOLD:
+                return count
+            cache.set(key, count, settings.ESTIMATED_COUNT_TIMEOUT)
+        self.estimated = True
+        return count
+
+    def _cache_key(self):
+        query = str(self.object_list.query).encode()
+        return 'estimated_count:' + hashlib.md5(query).hexdigest()
+
+    def _table_statistics(self):
+        """Число строк таблицы по статистике планировщика.
+
+        Годится только для выборки без условий.
+        """
+        queryset = self.object_list
+        if (not isinstance(queryset, QuerySet) or queryset.query.where
+                or not queryset.query.can_filter()):
+            return None
+        table = queryset.model._meta.db_table
+        connection = connections[queryset.db]
+        if connection.vendor == 'sqlite':
+            # Таблица появляется только после ANALYZE.
+            if not _fetch_one(connection, _SQLITE_STAT_EXISTS, []):
+                return None
+            # Первое число — строки таблицы.
+            sql = 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1'
+        elif connection.vendor == 'postgresql':
+            sql = 'SELECT reltuples::bigint FROM pg_class WHERE relname = %s'
+        else:
+            return None
+        try:
+            row = _fetch_one(connection, sql, [table])
+        except DatabaseError:
+            return None
+        if row is None:
+            return None
+        return int(str(row[0]).split()[0])
+
+
+_SQLITE_STAT_EXISTS = (
+    "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+    "AND name = 'sqlite_stat1'"
+)
+
+
+def _fetch_one(connection, sql, params):
+    """Читающий запрос без открытия транзакции.
+
+    Внутри чужой транзакции запрос идёт в точке сохранения, чтобы его
+    ошибка не сломала внешнюю транзакцию.
+    """
+    if connection.in_atomic_block:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                return cursor.fetchone()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()
+
+
+def paginator(request, posts, estimate_count=False, tiered=False):
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+    if page_number is not None:
+        # Старые ссылки вида ?page=N продолжают работать.
+        if isinstance(posts, (list, tuple)):
+            posts = posts[0].order_by().union(
+                *(source.order_by() for source in posts[1:])
+            ).order_by('-pub_date', '-pk')
+        paginator_class = (EstimatedCountPaginator if estimate_count
+                           else Paginator)
+        paginator = paginator_class(posts, settings.PAGE_SIZE)
+        return paginator.get_page(page_number)
+    paginator = CursorPaginator(posts, settings.PAGE_SIZE, tiered=tiered)
+    return paginator.get_page(request.GET.get('cursor'))
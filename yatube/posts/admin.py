@@ -1,8 +1,15 @@
 from django.contrib import admin
 
+from . import search
+from .forms import PostForm
 from .models import Group, Post
 
 
+class AdminPostForm(PostForm):
+    class Meta(PostForm.Meta):
+        fields = ('text', 'author', 'group', 'image')
+
+
 class PostAdmin(admin.ModelAdmin):
     list_display = (
         'pk',
@@ -15,6 +22,14 @@ class PostAdmin(admin.ModelAdmin):
     search_fields = ('text',)
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
+    # Картинки из админки проходят ту же обработку, что и с сайта.
+    form = AdminPostForm
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по полнотекстовому индексу вместо LIKE '%...%'.
+        if not search_term or not search.enabled():
+            return super().get_search_results(request, queryset, search_term)
+        return search.search(queryset, search_term), False
 
 
 admin.site.register(Post, PostAdmin)
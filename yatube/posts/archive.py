@@ -0,0 +1,92 @@
+"""Горячие и архивные посты.
+
+Посты старше ARCHIVE_AFTER_DAYS команда archive_posts переносит вместе
+с комментариями в ArchivedPost и ArchivedComment, и в posts_post
+остаются только свежие посты, которые читаются чаще всего. Ленты автора
+и группы и страница поста читают архив сами (post_sources, find_post),
+поэтому старые посты открываются по прежним адресам.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404
+from django.utils import timezone
+
+from . import counters, media
+from .models import ArchivedComment, ArchivedPost, Comment, Post
+
+POST_FIELDS = ('text', 'pub_date', 'modified', 'author_id', 'group_id',
+               'image', 'image_width', 'image_height', 'comment_count')
+COMMENT_FIELDS = ('post_id', 'text', 'author_id', 'created')
+
+
+def cutoff(days=None):
+    """Посты, опубликованные раньше этого момента, уходят в архив."""
+    if days is None:
+        days = settings.ARCHIVE_AFTER_DAYS
+    return timezone.now() - timedelta(days=days)
+
+
+def _copy(model, obj, fields):
+    return model(id=obj.pk, **{field: getattr(obj, field) for field in fields})
+
+
+def archive_batch(before, size):
+    """Переносит в архив до size постов старше before.
+
+    Возвращает число перенесённых постов.
+    """
+    with transaction.atomic():
+        # Партии идут от старых постов к новым: после каждой партии всё,
+        # что в архиве, старше всего, что осталось в горячей таблице.
+        posts = list(Post.objects.filter(pub_date__lt=before).order_by(
+            'pub_date', 'pk')[:size])
+        if not posts:
+            return 0
+        ids = [post.pk for post in posts]
+        ArchivedPost.objects.bulk_create(
+            _copy(ArchivedPost, post, POST_FIELDS) for post in posts)
+        # Архивная копия тоже ссылается на картинку, и удаление горячего
+        # поста не должно удалить файл.
+        for post in posts:
+            media.retain(post.image.name)
+        ArchivedComment.objects.bulk_create(
+            _copy(ArchivedComment, comment, COMMENT_FIELDS)
+            for comment in Comment.objects.filter(post_id__in=ids))
+        # Удаление проходит через сигналы: сбрасываются кеши страниц,
+        # индекс поиска и записи лент подписок.
+        Post.objects.filter(pk__in=ids).delete()
+        # Посты не удалены, а перенесены, поэтому счётчик постов автора
+        # возвращается к прежнему значению.
+        for author_id, count in Counter(
+                post.author_id for post in posts).items():
+            counters.change(author_id, 'post_count', count)
+    return len(posts)
+
+
+def post_sources(**filters):
+    """Источники ленты для CursorPaginator(tiered=True)."""
+    return [
+        Post.objects.feed().filter(**filters),
+        ArchivedPost.objects.feed().filter(**filters),
+    ]
+
+
+def comments_of(post_id):
+    """Комментарии поста из той же таблицы, где лежит сам пост."""
+    for model, comments in ((Post, Comment), (ArchivedPost, ArchivedComment)):
+        if model.objects.filter(pk=post_id).exists():
+            return comments.objects.filter(post_id=post_id)
+    raise Http404('Пост не найден')
+
+
+def find_post(post_id):
+    """Пост из горячей таблицы, а если его там нет — из архива."""
+    for model in (Post, ArchivedPost):
+        post = model.objects.select_related(
+            'author__counters', 'group').filter(pk=post_id).first()
+        if post is not None:
+            return post
+    raise Http404('Пост не найден')
@@ -0,0 +1,58 @@
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются сигналами вместе с самими объектами, а команда
+repair_counters пересчитывает разъехавшиеся значения.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import ArchivedPost, Follow, Post, UserCounters
+
+USER_COUNTERS = ('post_count', 'follower_count', 'following_count')
+
+
+def compute(user_id):
+    """Точные значения счётчиков пользователя по базе."""
+    return {
+        'post_count': (
+            Post.objects.filter(author_id=user_id).count()
+            + ArchivedPost.objects.filter(author_id=user_id).count()
+        ),
+        'follower_count': Follow.objects.filter(author_id=user_id).count(),
+        'following_count': Follow.objects.filter(user_id=user_id).count(),
+    }
+
+
+def recompute(user_id):
+    counters, _ = UserCounters.objects.update_or_create(
+        user_id=user_id, defaults=compute(user_id))
+    return counters
+
+
+def for_user(user):
+    """Счётчики пользователя; отсутствующая строка создаётся по базе."""
+    try:
+        return user.counters
+    except UserCounters.DoesNotExist:
+        return recompute(user.pk)
+
+
+def change(user_id, field, delta):
+    """Атомарно меняет счётчик пользователя на delta."""
+    updated = UserCounters.objects.filter(user_id=user_id).update(
+        **{field: F(field) + delta})
+    if updated or delta < 0:
+        # При удалении не создаём строку: пользователь может удаляться
+        # вместе со своими постами и подписками.
+        return
+    try:
+        with transaction.atomic():
+            recompute(user_id)
+    except IntegrityError:
+        # Пользователь уже удалён.
+        pass
+
+
+def change_comments(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comment_count=F('comment_count') + delta)
@@ -0,0 +1,64 @@
+"""Выгрузка всех постов автора файлом CSV или JSONL.
+
+Строки читаются итератором порциями по EXPORT_CHUNK_SIZE и сразу
+отдаются в StreamingHttpResponse, поэтому память не растёт с числом
+постов, а первые байты уходят клиенту до того, как прочитан весь архив.
+"""
+import csv
+import json
+
+from django.conf import settings
+
+from .models import ArchivedPost, Post
+from .storage import post_image_storage
+
+COLUMNS = ('text', 'group', 'pub_date', 'image')
+
+
+def author_posts(author, database):
+    """Кортежи COLUMNS для всех постов автора, от новых к старым.
+
+    database задаётся явно: генератор дочитывается уже после выхода
+    из view, когда выбор реплики для запроса снят.
+    """
+    for model in (Post, ArchivedPost):
+        rows = model.objects.using(database).filter(author=author).order_by(
+            '-pub_date', '-pk').values_list(
+            'text', 'group__slug', 'pub_date', 'image')
+        yield from rows.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def _image_url(name, absolute_url):
+    return absolute_url(post_image_storage.url(name)) if name else ''
+
+
+class _Echo:
+    """Буфер для csv.writer, который просто возвращает записанное."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, absolute_url):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for text, group, pub_date, image in rows:
+        yield writer.writerow((text, group or '', pub_date.isoformat(),
+                               _image_url(image, absolute_url)))
+
+
+def jsonl_lines(rows, absolute_url):
+    for text, group, pub_date, image in rows:
+        yield json.dumps({
+            'text': text,
+            'group': group,
+            'pub_date': pub_date.isoformat(),
+            'image': _image_url(image, absolute_url) or None,
+        }, ensure_ascii=False) + '\n'
+
+
+# Формат -> (Content-Type, генератор строк).
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', csv_lines),
+    'jsonl': ('application/x-ndjson; charset=utf-8', jsonl_lines),
+}
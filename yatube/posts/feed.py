@@ -0,0 +1,154 @@
+"""Гибридная лента подписок.
+
+Посты обычных авторов сразу раскладываются в ленты подписчиков
+(fan-out on write), поэтому страница «Избранные авторы» читает готовые
+записи по индексу (user, -pub_date). Авторы, у которых подписчиков
+больше FEED_PULL_THRESHOLD, переводятся в режим pull: их посты никуда
+не раскладываются, а подмешиваются к ленте при чтении k-way слиянием.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from . import counters, follow_graph
+from .models import Follow, Post, PullAuthor, TimelineEntry
+
+PULL_AUTHORS_KEY = 'feed:pull_authors'
+STATS_PREFIX = 'feed:stats:'
+STATS_PATHS = ('push', 'pull', 'hybrid', 'fan_out', 'fan_out_skipped')
+
+
+def _count(path):
+    key = STATS_PREFIX + path
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def stats():
+    """Сколько раз лента строилась каждым из путей."""
+    values = cache.get_many([STATS_PREFIX + path for path in STATS_PATHS])
+    return {path: values.get(STATS_PREFIX + path, 0) for path in STATS_PATHS}
+
+
+def pull_authors():
+    """Множество id авторов, работающих в режиме pull."""
+    authors = cache.get(PULL_AUTHORS_KEY)
+    if authors is None:
+        authors = frozenset(
+            PullAuthor.objects.values_list('author_id', flat=True))
+        # promote_if_popular сбрасывает ключ только в своём процессе,
+        # если кеш не общий, поэтому список перечитывается регулярно.
+        cache.set(PULL_AUTHORS_KEY, authors,
+                  settings.PULL_AUTHORS_TIMEOUT)
+    return authors
+
+
+def promote_if_popular(author):
+    """Переводит автора в режим pull, когда подписчиков стало много.
+
+    Обратного перевода нет: иначе посты, написанные в режиме pull,
+    пропали бы из лент подписчиков.
+    """
+    if author.pk in pull_authors():
+        return
+    followers = counters.for_user(author).follower_count
+    if followers >= settings.FEED_PULL_THRESHOLD:
+        PullAuthor.objects.get_or_create(author=author)
+        cache.delete(PULL_AUTHORS_KEY)
+
+
+def _bulk_add(entries):
+    TimelineEntry.objects.bulk_create(
+        entries,
+        batch_size=settings.FAN_OUT_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def fan_out_post(post):
+    """Кладёт новый пост в ленты всех подписчиков автора."""
+    if post.author_id in pull_authors():
+        _count('fan_out_skipped')
+        return
+    _count('fan_out')
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    batch = []
+    for user_id in followers.iterator(
+            chunk_size=settings.FAN_OUT_BATCH_SIZE):
+        batch.append(TimelineEntry(user_id=user_id, post=post,
+                                   pub_date=post.pub_date))
+        if len(batch) >= settings.FAN_OUT_BATCH_SIZE:
+            _bulk_add(batch)
+            batch = []
+    if batch:
+        _bulk_add(batch)
+
+
+def backfill(user, author):
+    """Добавляет в ленту свежие посты автора после подписки."""
+    if author.pk in pull_authors():
+        return
+    posts = Post.objects.filter(author=author).order_by(
+        '-pub_date').values_list('pk', 'pub_date')
+    _bulk_add([
+        TimelineEntry(user=user, post_id=post_id, pub_date=pub_date)
+        for post_id, pub_date in posts[:settings.TIMELINE_SIZE]
+    ])
+    trim(user)
+
+
+def drop_author(user, author):
+    """Убирает из ленты посты автора после отписки."""
+    TimelineEntry.objects.filter(user=user, post__author=author).delete()
+
+
+def trim(user):
+    """Оставляет в ленте не больше TIMELINE_SIZE последних записей."""
+    oldest_kept = TimelineEntry.objects.filter(user=user).order_by(
+        '-pub_date').values_list('pub_date', flat=True)[
+        settings.TIMELINE_SIZE - 1:settings.TIMELINE_SIZE]
+    oldest_kept = list(oldest_kept)
+    if oldest_kept:
+        TimelineEntry.objects.filter(
+            user=user, pub_date__lt=oldest_kept[0]).delete()
+
+
+def overgrown():
+    """id читателей, чьи ленты длиннее TIMELINE_SIZE.
+
+    Раскладка поста ленты не подрезает, чтобы не держать блокировку
+    записи; их подрезают страница подписок и команда trim_timelines.
+    """
+    return TimelineEntry.objects.order_by().values('user_id').annotate(
+        total=Count('pk')).filter(
+        total__gt=settings.TIMELINE_SIZE).values_list('user_id', flat=True)
+
+
+def timeline(user):
+    """Посты из материализованной ленты пользователя."""
+    return Post.objects.feed().filter(timeline_entries__user=user)
+
+
+def home_feed(user):
+    """Источники ленты подписок для CursorPaginator.
+
+    Первый источник — материализованная лента, остальные — посты
+    каждого pull-автора, на которого подписан пользователь.
+    """
+    following = set(follow_graph.following(user.pk))
+    pulled = sorted(following & pull_authors())
+    if not pulled:
+        _count('push')
+    elif len(pulled) == len(following):
+        _count('pull')
+    else:
+        _count('hybrid')
+    return [timeline(user)] + [
+        Post.objects.feed().filter(author_id=author_id)
+        for author_id in pulled
+    ]
@@ -0,0 +1,96 @@
+"""Граф подписок в кеше.
+
+Для каждого пользователя хранится отсортированный массив id авторов,
+на которых он подписан. Массив читается из Follow при первом обращении,
+а дальше поправляется сигналами подписки и отписки после фиксации
+транзакции, поэтому проверки «подписан ли A на B» не ходят в базу.
+"""
+from array import array
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Follow
+
+KEY_PREFIX = 'follow_graph:'
+
+
+def _key(user_id):
+    return f'{KEY_PREFIX}{user_id}'
+
+
+def _contains(authors, author_id):
+    index = bisect_left(authors, author_id)
+    return index < len(authors) and authors[index] == author_id
+
+
+def _load(user_id):
+    # Граф читается с основной базы: подписки с отставшей реплики
+    # остались бы в кеше до истечения таймаута.
+    return array('q', Follow.objects.using('default').filter(
+        user_id=user_id).order_by('author_id').values_list(
+        'author_id', flat=True))
+
+
+def _pending(user_id):
+    """Есть ли у user_id подписки, ждущие фиксации транзакции."""
+    return any(getattr(callback, 'follow_graph_user', None) == user_id
+               for _, callback in transaction.get_connection().run_on_commit)
+
+
+def following(user_id):
+    """Отсортированный массив id авторов, на которых подписан user_id."""
+    if _pending(user_id):
+        # Незафиксированные подписки видны только этому соединению,
+        # и в кеш такой массив не попадает.
+        return _load(user_id)
+    key = _key(user_id)
+    authors = cache.get(key)
+    if authors is None:
+        authors = _load(user_id)
+        cache.set(key, authors, settings.FOLLOW_GRAPH_TIMEOUT)
+    return authors
+
+
+def follows(user_id, author_id):
+    """Подписан ли user_id на author_id."""
+    return _contains(following(user_id), author_id)
+
+
+def followed_among(user_id, author_ids):
+    """Множество тех из author_ids, на кого подписан user_id."""
+    authors = following(user_id)
+    return {author_id for author_id in author_ids
+            if _contains(authors, author_id)}
+
+
+def _on_commit(user_id, patch):
+    # При откате транзакции правка не выполнится, и граф в кеше
+    # останется таким же, как подписки в базе.
+    def callback():
+        patch()
+    callback.follow_graph_user = user_id
+    transaction.on_commit(callback)
+
+
+def add(user_id, author_id):
+    # Массив, которого нет в кеше, будет прочитан из базы уже с новой
+    # подпиской. Одновременные правки одного пользователя могут
+    # затереть друг друга, такой массив исправит FOLLOW_GRAPH_TIMEOUT.
+    def patch():
+        authors = cache.get(_key(user_id))
+        if authors is not None and not _contains(authors, author_id):
+            insort(authors, author_id)
+            cache.set(_key(user_id), authors, settings.FOLLOW_GRAPH_TIMEOUT)
+    _on_commit(user_id, patch)
+
+
+def remove(user_id, author_id):
+    def patch():
+        authors = cache.get(_key(user_id))
+        if authors is not None and _contains(authors, author_id):
+            del authors[bisect_left(authors, author_id)]
+            cache.set(_key(user_id), authors, settings.FOLLOW_GRAPH_TIMEOUT)
+    _on_commit(user_id, patch)
@@ -1,5 +1,6 @@
 from django import forms
 
+from .images import IngestImageField
 from .models import Comment, Post
 
 
@@ -7,6 +8,7 @@ class PostForm(forms.ModelForm):
     class Meta:
         model = Post
         fields = ('group', 'text', 'image')
+        field_classes = {'image': IngestImageField}
         labels = {
             'text': 'Текс поста',
             'group': 'Название группы'
@@ -16,6 +18,17 @@ class PostForm(forms.ModelForm):
             'group': 'Группа, к которой будет относиться пост'
         }
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        # False — картинку удалили, новый файл пришёл из ingest,
+        # иначе картинка осталась прежней.
+        if image is False:
+            self.instance.image_width = self.instance.image_height = None
+        elif hasattr(image, 'image_width'):
+            self.instance.image_width = image.image_width
+            self.instance.image_height = image.image_height
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,73 @@
+"""Области данных, по поколениям которых кешируются страницы постов."""
+from core.cache import bump_on_commit as bump
+
+from .models import ArchivedPost, Post
+
+INDEX_SCOPES = ('posts', 'groups')
+
+
+def group_scope(slug):
+    return f'group:{slug}'
+
+
+def author_scope(username):
+    return f'author:{username}'
+
+
+def post_scope(post_id):
+    return f'post:{post_id}'
+
+
+def index_scopes():
+    return INDEX_SCOPES
+
+
+def group_list_scopes():
+    return ('groups',)
+
+
+def group_page_scopes(slug):
+    return (group_scope(slug), 'groups')
+
+
+def profile_page_scopes(username):
+    return (author_scope(username), 'groups')
+
+
+def post_page_scopes(post_id):
+    # На странице поста есть число постов автора, поэтому она зависит
+    # и от поколения автора.
+    for model in (Post, ArchivedPost):
+        username = model.objects.filter(pk=post_id).values_list(
+            'author__username', flat=True).first()
+        if username is not None:
+            break
+    else:
+        return None
+    return (post_scope(post_id), author_scope(username), 'groups')
+
+
+def post_changed(post, old_group_slug=None):
+    """Пост создан, изменён или удалён."""
+    scopes = ['posts', post_scope(post.pk), author_scope(post.author.username)]
+    for slug in (old_group_slug, post.group.slug if post.group else None):
+        if slug:
+            scopes.append(group_scope(slug))
+    bump(*scopes)
+
+
+def comment_changed(comment):
+    """Комментарий добавлен или удалён."""
+    bump(post_scope(comment.post_id))
+
+
+def group_changed(group, old_slug=None):
+    """Группа создана, изменена или удалена."""
+    bump('groups', *(group_scope(slug) for slug in (old_slug, group.slug)
+                     if slug))
+
+
+def follow_changed(follow):
+    """Подписка создана или удалена: меняются оба профиля."""
+    bump(author_scope(follow.author.username),
+         author_scope(follow.user.username))
@@ -0,0 +1,102 @@
+"""Приём картинок постов.
+
+Загрузка обрезается на IMAGE_MAX_BYTES ещё во время приёма
+(LimitedUploadHandler), размер в пикселях проверяется по заголовку
+до декодирования, анимированные картинки отклоняются, а остальные
+уменьшаются до IMAGE_MAX_SIDE и пересохраняются в WebP без метаданных.
+Большие файлы всё это время лежат во временных файлах на диске,
+а не в памяти.
+"""
+import io
+import os
+import tempfile
+
+from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps, features
+
+FORMAT, EXTENSION = (('WEBP', 'webp') if features.check('webp')
+                     else ('JPEG', 'jpg'))
+
+
+class LimitedUploadHandler(FileUploadHandler):
+    """Перестаёт сохранять файл, как только он превысил IMAGE_MAX_BYTES.
+
+    Остаток файла дочитывается из запроса и выбрасывается, а вместо
+    файла форма получает пустой UploadedFile с настоящим размером,
+    по которому и сообщает об ошибке.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.IMAGE_MAX_BYTES:
+            return None
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.received <= settings.IMAGE_MAX_BYTES:
+            return None
+        return UploadedFile(io.BytesIO(), name=self.file_name,
+                            content_type=self.content_type,
+                            size=self.received)
+
+
+def ingest(upload):
+    """Уменьшенная и пересохранённая копия загруженной картинки.
+
+    У результата есть атрибуты image_width и image_height.
+    """
+    upload.seek(0)
+    with Image.open(upload) as source:
+        if source.width * source.height > settings.IMAGE_MAX_PIXELS:
+            raise forms.ValidationError(
+                'Картинка больше %(limit)s пикселей.',
+                code='too_many_pixels',
+                params={'limit': settings.IMAGE_MAX_PIXELS})
+        # Пересохранение оставило бы от анимации только первый кадр.
+        if getattr(source, 'is_animated', False):
+            raise forms.ValidationError(
+                'Анимированные картинки не поддерживаются.',
+                code='animated')
+        side = settings.IMAGE_MAX_SIDE
+        # JPEG сразу декодируется в уменьшенном в 2-8 раз виде.
+        source.draft('RGB', (side, side))
+        # Поворот из EXIF применяется до того, как EXIF будет отброшен.
+        image = ImageOps.exif_transpose(source)
+    image.thumbnail((side, side), Image.LANCZOS)
+    has_alpha = image.mode in ('RGBA', 'LA') or (
+        image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha and FORMAT == 'WEBP' else 'RGB')
+    output = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    # Метаданные (EXIF, ICC, XMP) передаются в save только явно,
+    # поэтому в новый файл они не попадают.
+    image.save(output, FORMAT, quality=settings.IMAGE_QUALITY)
+    size = output.tell()
+    output.seek(0)
+    name = os.path.splitext(os.path.basename(upload.name))[0]
+    result = UploadedFile(output, name=f'{name}.{EXTENSION}',
+                          content_type=f'image/{EXTENSION}', size=size)
+    result.image_width, result.image_height = image.size
+    return result
+
+
+class IngestImageField(forms.ImageField):
+    """ImageField, который пропускает картинку через ingest."""
+
+    def to_python(self, data):
+        if data is not None and data.size > settings.IMAGE_MAX_BYTES:
+            raise forms.ValidationError(
+                'Файл больше %(limit)s.', code='too_large',
+                params={'limit': filesizeformat(settings.IMAGE_MAX_BYTES)})
+        checked = super().to_python(data)
+        if checked is None:
+            return None
+        return ingest(checked)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from posts import archive
+
+
+class Command(BaseCommand):
+    help = ('Переносит посты старше ARCHIVE_AFTER_DAYS вместе '
+            'с комментариями в архивные таблицы.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        before = archive.cutoff(options['days'])
+        total = 0
+        while True:
+            moved = archive.archive_batch(before, options['batch_size'])
+            if not moved:
+                break
+            total += moved
+            self.stdout.write(f'Перенесено постов: {total}')
+        self.stdout.write(f'Готово, в архив перенесено {total} постов')
@@ -0,0 +1,31 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from posts.transfer import export_lines
+
+
+class Command(BaseCommand):
+    help = ('Выгружает пользователей, группы, посты, комментарии '
+            'и подписки в JSONL.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', nargs='?', default='-',
+                            help='Файл для выгрузки, по умолчанию stdout.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if options['output'] == '-':
+            self.export(self.stdout, options['chunk_size'])
+            return
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            self.export(output, options['chunk_size'])
+
+    def export(self, output, chunk_size):
+        totals = Counter()
+        for label, line in export_lines(chunk_size):
+            output.write(line + '\n')
+            totals[label] += 1
+        # Итоги идут в stderr, чтобы не смешиваться с данными в stdout.
+        for label, total in totals.items():
+            self.stderr.write(f'{label}: {total}')
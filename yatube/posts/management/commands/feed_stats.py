@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts import feed
+
+
+class Command(BaseCommand):
+    help = 'Показывает, каким путём строились ленты подписок.'
+
+    def handle(self, *args, **options):
+        for path, value in feed.stats().items():
+            self.stdout.write(f'{path}: {value}')
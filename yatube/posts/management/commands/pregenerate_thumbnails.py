@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import ArchivedPost, Post
+
+
+class Command(BaseCommand):
+    help = ('Строит недостающие миниатюры для картинок всех постов, '
+            'включая архивные.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        self.processed = 0
+        self.failed = 0
+        chunks = self.chunks(options['batch_size'])
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                # Порция уходит в пул сразу после чтения; результаты
+                # предыдущей собираются, пока считается следующая.
+                pending = []
+                for names in chunks:
+                    futures = [
+                        pool.submit(thumbnails.generate_in_worker, name)
+                        for name in names
+                    ]
+                    self.collect(future.result() for future in pending)
+                    pending = futures
+                self.collect(future.result() for future in pending)
+        else:
+            for names in chunks:
+                self.collect(thumbnails.generate(name) for name in names)
+        self.stdout.write(f'Картинок обработано: {self.processed}, '
+                          f'с ошибками: {self.failed}')
+
+    def chunks(self, size):
+        """Имена картинок порциями по возрастанию pk, без полного списка.
+
+        Одна картинка у нескольких постов может попасть в разные порции;
+        повторный проход находит готовые миниатюры и ничего не строит.
+        """
+        for model in (Post, ArchivedPost):
+            last_pk = 0
+            while True:
+                rows = list(model.objects.filter(pk__gt=last_pk).exclude(
+                    image='').order_by('pk').values_list('pk', 'image')[:size])
+                if not rows:
+                    break
+                last_pk = rows[-1][0]
+                yield sorted({name for pk, name in rows})
+
+    def collect(self, results):
+        for result in results:
+            self.processed += 1
+            if result is False:
+                self.failed += 1
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import search
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Переиндексирует тексты постов для полнотекстового поиска.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not search.enabled():
+            self.stdout.write('Полнотекстовый индекс есть только в SQLite.')
+            return
+        size = options['batch_size']
+        last_pk, total = 0, 0
+        while True:
+            # Порции по первичному ключу: поиск продолжает работать
+            # на старом индексе, пока идёт переиндексация.
+            rows = list(Post.objects.filter(pk__gt=last_pk).order_by(
+                'pk').values_list('pk', 'text')[:size])
+            if not rows:
+                break
+            with transaction.atomic():
+                search.index_posts(rows)
+            total += len(rows)
+            last_pk = rows[-1][0]
+        search.drop_orphans()
+        self.stdout.write(f'Проиндексировано постов: {total}')
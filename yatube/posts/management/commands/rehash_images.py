@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import media
+from posts.models import ArchivedPost, Post
+from posts.storage import is_addressed, post_image_storage
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки постов со старыми именами в хранилище '
+            'по содержимому и переписывает пути в базе порциями.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        # Старое имя -> новое: на один старый файл могут ссылаться
+        # несколько постов, а сам файл удаляется после первой же порции.
+        self.renamed = {}
+        self.missing = 0
+        for model in (Post, ArchivedPost):
+            self.rehash_model(model, options['batch_size'])
+        self.stdout.write(f'Перенесено файлов: {len(self.renamed)}, '
+                          f'не найдено: {self.missing}')
+
+    def rehash_model(self, model, size):
+        last_pk = 0
+        while True:
+            rows = list(model.objects.filter(pk__gt=last_pk).exclude(
+                image='').order_by('pk').values_list('pk', 'image')[:size])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            moved = []
+            with transaction.atomic():
+                for pk, name in rows:
+                    if is_addressed(name):
+                        continue
+                    new = self.rehash(name)
+                    if new is None:
+                        self.missing += 1
+                        continue
+                    model.objects.filter(pk=pk).update(image=new)
+                    media.retain(new)
+                    moved.append(name)
+            # Старые файлы удаляются только после коммита порции.
+            for name in moved:
+                if post_image_storage.exists(name):
+                    post_image_storage.delete(name)
+
+    def rehash(self, name):
+        if name in self.renamed:
+            return self.renamed[name]
+        if not post_image_storage.exists(name):
+            return None
+        with post_image_storage.open(name) as content:
+            new = post_image_storage.save(name, content)
+        self.renamed[name] = new
+        return new
@@ -0,0 +1,87 @@
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from posts.counters import USER_COUNTERS
+from posts.models import ArchivedPost, Follow, Post, UserCounters
+
+User = get_user_model()
+
+
+def _chunks(queryset, size):
+    """Последовательные порции id по возрастанию первичного ключа."""
+    last_pk = 0
+    while True:
+        ids = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list(
+            'pk', flat=True)[:size])
+        if not ids:
+            return
+        yield ids
+        last_pk = ids[-1]
+
+
+def _grouped(queryset, field, ids):
+    rows = queryset.filter(**{f'{field}__in': ids}).order_by().values(
+        field).annotate(total=Count('pk')).values_list(field, 'total')
+    return dict(rows)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает разъехавшиеся счётчики постов и подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        size = options['chunk_size']
+        users = sum(self.repair_users(ids) for ids in _chunks(
+            User.objects.all(), size))
+        posts = sum(self.repair_posts(ids) for ids in _chunks(
+            Post.objects.all(), size))
+        self.stdout.write(
+            f'Исправлено счётчиков: пользователей {users}, постов {posts}')
+
+    @transaction.atomic
+    def repair_users(self, ids):
+        actual = {
+            'post_count': (
+                Counter(_grouped(Post.objects, 'author_id', ids))
+                + Counter(_grouped(ArchivedPost.objects, 'author_id', ids))
+            ),
+            'follower_count': _grouped(Follow.objects, 'author_id', ids),
+            'following_count': _grouped(Follow.objects, 'user_id', ids),
+        }
+        stored = UserCounters.objects.select_for_update().in_bulk(ids)
+        drifted, missing = [], []
+        for user_id in ids:
+            values = {
+                field: actual[field].get(user_id, 0)
+                for field in USER_COUNTERS
+            }
+            counters = stored.get(user_id)
+            if counters is None:
+                missing.append(UserCounters(user_id=user_id, **values))
+                continue
+            if any(getattr(counters, field) != value
+                   for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(counters, field, value)
+                drifted.append(counters)
+        UserCounters.objects.bulk_create(missing)
+        UserCounters.objects.bulk_update(drifted, USER_COUNTERS)
+        return len(missing) + len(drifted)
+
+    @transaction.atomic
+    def repair_posts(self, ids):
+        posts = Post.objects.filter(pk__in=ids).annotate(
+            actual=Count('comments')).only('comment_count')
+        drifted = []
+        for post in posts:
+            if post.comment_count != post.actual:
+                post.comment_count = post.actual
+                drifted.append(post)
+        Post.objects.bulk_update(drifted, ('comment_count',))
+        return len(drifted)
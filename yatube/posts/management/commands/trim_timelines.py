@@ -0,0 +1,22 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import feed
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Подрезает ленты подписок до TIMELINE_SIZE записей, в том '
+            'числе у читателей, которые не открывают страницу подписок.')
+
+    def handle(self, *args, **options):
+        total = 0
+        for user_id in list(feed.overgrown()):
+            # Каждая лента в своей короткой транзакции, чтобы не держать
+            # блокировку записи на всё время команды.
+            with transaction.atomic():
+                feed.trim(User(pk=user_id))
+            total += 1
+        self.stdout.write(f'Подрезано лент: {total}')
@@ -0,0 +1,47 @@
+"""Счётчики ссылок на картинки в хранилище по содержимому.
+
+Один файл может принадлежать нескольким постам, горячим и архивным.
+Сигналы постов увеличивают и уменьшают счётчик, и файл удаляется после
+коммита, когда на него не осталось ссылок. Старые файлы с обычными
+именами не учитываются и не удаляются, пока их не переименует
+команда rehash_images.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import StoredFile
+from .storage import is_addressed, post_image_storage
+
+
+def retain(name, count=1):
+    """Добавляет count ссылок на файл name."""
+    if not is_addressed(name):
+        return
+    updated = StoredFile.objects.filter(name=name).update(
+        ref_count=F('ref_count') + count)
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            StoredFile.objects.create(name=name, ref_count=count)
+    except IntegrityError:
+        # Строку только что создал параллельный запрос.
+        StoredFile.objects.filter(name=name).update(
+            ref_count=F('ref_count') + count)
+
+
+def release(name):
+    """Убирает ссылку на файл name и удаляет осиротевший файл."""
+    if not is_addressed(name):
+        return
+    StoredFile.objects.filter(name=name, ref_count__gt=0).update(
+        ref_count=F('ref_count') - 1)
+    deleted, _ = StoredFile.objects.filter(name=name, ref_count=0).delete()
+    if deleted:
+        transaction.on_commit(lambda: _delete_orphan(name))
+
+
+def _delete_orphan(name):
+    # Пока транзакция завершалась, ту же картинку могли загрузить снова.
+    if not StoredFile.objects.filter(name=name).exists():
+        post_image_storage.delete(name)
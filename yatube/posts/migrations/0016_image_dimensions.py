@@ -0,0 +1,49 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:57
+
+from django.core.files.images import get_image_dimensions
+from django.db import migrations, models
+
+
+def record_dimensions(apps, schema_editor):
+    # Старые картинки не проходили обработку; размеры читаются из
+    # заголовков файлов, пропавшие файлы остаются без размеров.
+    for name in ('Post', 'ArchivedPost'):
+        model = apps.get_model('posts', name)
+        for post in model.objects.exclude(image='').only('image').iterator():
+            try:
+                width, height = get_image_dimensions(post.image)
+            except OSError:
+                continue
+            model.objects.filter(pk=post.pk).update(
+                image_width=width, image_height=height)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedpost',
+            name='image_height',
+            field=models.PositiveIntegerField(null=True, verbose_name='Высота картинки'),
+        ),
+        migrations.AddField(
+            model_name='archivedpost',
+            name='image_width',
+            field=models.PositiveIntegerField(null=True, verbose_name='Ширина картинки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота картинки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина картинки'),
+        ),
+        migrations.RunPython(record_dimensions, migrations.RunPython.noop),
+    ]
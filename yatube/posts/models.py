@@ -2,6 +2,8 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .storage import post_image_storage
+
 User = get_user_model()
 
 
@@ -14,6 +16,20 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    # Поля, которые выводит карточка поста posts/includes/post_core.html.
+    FEED_FIELDS = (
+        'text', 'pub_date', 'modified', 'image',
+        'author', 'author__username',
+        'author__first_name', 'author__last_name',
+        'group', 'group__slug',
+    )
+
+    def feed(self):
+        """Посты для лент: автор и группа подтягиваются одним запросом."""
+        return self.select_related('author', 'group').only(*self.FEED_FIELDS)
+
+
 class Post(models.Model):
     text = models.TextField(
         verbose_name='Текст поста',
@@ -24,6 +40,10 @@ class Post(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    modified = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -41,13 +61,40 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=post_image_storage,
         blank=True
     )
+    # Размеры записывает PostForm после обработки картинки
+    # (posts/images.py). width_field не используется: для старых постов
+    # без размеров Django открывал бы файл при каждой загрузке поста.
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки', null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(
+        'Высота картинки', null=True, blank=True, editable=False)
+    comment_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
+
+    # Архивные посты только читаются, см. ArchivedPost.
+    archived = False
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Ленты автора и группы читаются по индексу уже в нужном порядке.
+        # Столбцы по возрастанию: SQLite обходит индекс с конца, и тогда
+        # неявный rowid в хвосте индекса даёт и сортировку pk DESC.
+        indexes = (
+            models.Index(fields=('author', 'pub_date'),
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=('group', 'pub_date'),
+                         name='post_group_pub_date_idx'),
+        )
 
     def __str__(self):
         return self.text[:settings.COUNT_TEXT]
@@ -77,6 +124,10 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created']
+        indexes = (
+            models.Index(fields=('post', 'created'),
+                         name='comment_post_created_idx'),
+        )
 
 
 class Follow(models.Model):
@@ -90,3 +141,160 @@ class Follow(models.Model):
         on_delete=models.CASCADE,
         related_name='following'
     )
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(fields=('user', 'author'),
+                                    name='follow_unique_user_author'),
+        )
+
+
+class TimelineEntry(models.Model):
+    """Запись в материализованной ленте подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        ordering = ('-pub_date',)
+        indexes = (
+            models.Index(fields=('user', '-pub_date'),
+                         name='timeline_user_pub_date_idx'),
+        )
+        constraints = (
+            models.UniqueConstraint(fields=('user', 'post'),
+                                    name='timeline_unique_user_post'),
+        )
+
+
+class PullAuthor(models.Model):
+    """Популярный автор, посты которого читаются из его ленты при чтении.
+
+    Посты таких авторов не раскладываются по лентам подписчиков.
+    """
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='pull_mode',
+        verbose_name='Автор'
+    )
+    since = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата перевода в pull'
+    )
+
+
+class UserCounters(models.Model):
+    """Счётчики пользователя, которые иначе пришлось бы считать COUNT(*)."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counters',
+        verbose_name='Пользователь'
+    )
+    post_count = models.PositiveIntegerField('Постов', default=0)
+    follower_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+
+class StoredFile(models.Model):
+    """Файл картинки и число постов, которые на него ссылаются."""
+    name = models.CharField('Имя файла', max_length=255, primary_key=True)
+    ref_count = models.PositiveIntegerField('Ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+
+class ArchivedPost(models.Model):
+    """Старый пост, перенесённый из горячей таблицы командой archive_posts.
+
+    id совпадает с id исходного поста, поэтому ссылки на пост продолжают
+    работать. Архивные посты нельзя редактировать и комментировать.
+    """
+    id = models.IntegerField(primary_key=True)
+    text = models.TextField(verbose_name='Текст поста')
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+    modified = models.DateTimeField(verbose_name='Дата изменения')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_posts',
+        verbose_name='Автор'
+    )
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.SET_NULL,
+        related_name='archived_posts',
+        blank=True,
+        null=True,
+        verbose_name='Группа'
+    )
+    image = models.ImageField('Картинка', upload_to='posts/',
+                              storage=post_image_storage, blank=True)
+    image_width = models.PositiveIntegerField('Ширина картинки', null=True)
+    image_height = models.PositiveIntegerField('Высота картинки', null=True)
+    comment_count = models.PositiveIntegerField('Число комментариев',
+                                                default=0)
+    archived_at = models.DateTimeField('Дата архивации', auto_now_add=True)
+
+    objects = PostQuerySet.as_manager()
+
+    archived = True
+
+    class Meta:
+        ordering = ('-pub_date',)
+        verbose_name = 'Архивный пост'
+        verbose_name_plural = 'Архивные посты'
+        indexes = (
+            models.Index(fields=('author', 'pub_date'),
+                         name='archived_author_pub_date_idx'),
+            models.Index(fields=('group', 'pub_date'),
+                         name='archived_group_pub_date_idx'),
+        )
+
+    def __str__(self):
+        return self.text[:settings.COUNT_TEXT]
+
+
+class ArchivedComment(models.Model):
+    """Комментарий к архивному посту."""
+    id = models.IntegerField(primary_key=True)
+    post = models.ForeignKey(
+        ArchivedPost,
+        on_delete=models.CASCADE,
+        related_name='comments',
+        verbose_name='Пост'
+    )
+    text = models.TextField(verbose_name='Текст коментария')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_comments',
+        verbose_name='Автор'
+    )
+    created = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        ordering = ['-created']
+        indexes = (
+            models.Index(fields=('post', 'created'),
+                         name='archived_comment_created_idx'),
+        )
@@ -0,0 +1,76 @@
+"""Полнотекстовый поиск по постам на SQLite FTS5.
+
+Тексты постов копируются в виртуальную таблицу posts_post_fts
+(rowid — id поста), которую сигналы обновляют при сохранении и удалении
+поста. Массовые update() мимо сигналов выправляет команда
+rebuild_search_index. На других СУБД поиск сводится к icontains.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+FTS_TABLE = 'posts_post_fts'
+WORD_RE = re.compile(r'\w+')
+
+
+def enabled():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """Выражение MATCH из запроса пользователя.
+
+    Каждое слово ищется как префикс, а операторы и кавычки FTS5
+    отбрасываются, поэтому любой ввод даёт корректный запрос.
+    """
+    return ' '.join(f'"{word}"*' for word in WORD_RE.findall(query))
+
+
+def index_posts(rows):
+    """Добавляет или обновляет в индексе посты из пар (id, text)."""
+    rows = list(rows)
+    if not enabled() or not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                           [(pk,) for pk, _ in rows])
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)', rows)
+
+
+def unindex_post(pk):
+    if enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [pk])
+
+
+def drop_orphans():
+    """Убирает из индекса посты, которых больше нет в базе."""
+    if enabled():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid NOT IN '
+                f'(SELECT id FROM posts_post)')
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+
+
+def search(queryset, query):
+    """Посты queryset, подходящие под запрос, от самых релевантных."""
+    words = WORD_RE.findall(query)
+    if not words:
+        return queryset.none()
+    if not enabled():
+        condition = Q()
+        for word in words:
+            condition &= Q(text__icontains=word)
+        return queryset.filter(condition).order_by('-pub_date')
+    table = queryset.model._meta.db_table
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = {table}.id', f'{FTS_TABLE} MATCH %s'],
+        params=[match_expression(query)],
+        select={'rank': f'{FTS_TABLE}.rank'},
+        order_by=('rank', '-pub_date'),
+    )
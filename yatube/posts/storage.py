@@ -0,0 +1,47 @@
+"""Хранилище картинок постов, адресуемое содержимым.
+
+Файл называется по SHA-256 своего содержимого и лежит в подкаталогах
+по первым байтам хеша: posts/ab/cd/abcd….webp. Одинаковые загрузки
+получают одно имя и хранятся один раз, а сколько постов ссылается
+на файл, считает posts.media.
+"""
+import hashlib
+import os
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+ADDRESSED_RE = re.compile(
+    r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+def is_addressed(name):
+    """Названо ли имя по содержимому (старые файлы названы иначе)."""
+    return bool(name) and ADDRESSED_RE.search(name) is not None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:2], digest[2:4],
+                            digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            # Такая картинка уже загружена.
+            return name
+        return super().save(name, content, max_length)
+
+
+post_image_storage = ContentAddressedStorage()
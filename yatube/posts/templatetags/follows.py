@@ -0,0 +1,13 @@
+from django import template
+
+from posts import follow_graph
+
+register = template.Library()
+
+
+@register.filter
+def follows(user, author_id):
+    """Подписан ли пользователь на автора с данным id."""
+    if not user.is_authenticated:
+        return False
+    return follow_graph.follows(user.pk, author_id)
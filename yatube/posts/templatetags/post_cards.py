@@ -0,0 +1,47 @@
+import hashlib
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from core.cache import generations
+from posts import thumbnails
+
+register = template.Library()
+
+CARD_TEMPLATE = 'posts/includes/post_card.html'
+
+
+def card_key(post, groups_generation):
+    # Карточка меняется вместе с постом, ссылками на группы и именем
+    # автора, которое может быть не ASCII, поэтому в ключ идёт хеш.
+    author = hashlib.md5('{}|{}|{}'.format(
+        post.author.username, post.author.first_name,
+        post.author.last_name).encode()).hexdigest()
+    return 'post_card:{}:{}:{}:{}'.format(
+        post.pk, post.modified.timestamp(), groups_generation, author)
+
+
+@register.simple_tag
+def post_cards(posts):
+    """HTML карточек постов страницы: из кеша или отрисованные заново.
+
+    Все карточки страницы достаются одним get_many, отрисовываются
+    только промахи, а миниатюры для них ищутся тоже одним запросом.
+    """
+    posts = list(posts)
+    groups_generation, = generations('groups')
+    keys = [card_key(post, groups_generation) for post in posts]
+    cached = cache.get_many(keys)
+    missing = {key: post for key, post in zip(keys, posts)
+               if key not in cached}
+    with thumbnails.prefetch(missing.values()):
+        for key, post in missing.items():
+            missing[key] = render_to_string(CARD_TEMPLATE, {'post': post})
+    cards = [mark_safe(cached[key] if key in cached else missing[key])
+             for key in keys]
+    if missing:
+        cache.set_many(missing, settings.POST_CARD_CACHE_TIMEOUT)
+    return cards
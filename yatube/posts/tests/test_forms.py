@@ -1,13 +1,24 @@
+import os
+import re
 import shutil
 import tempfile
+from io import BytesIO, StringIO
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.core.management import call_command
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
 from django.urls import reverse
 
-from posts.models import Comment, Group, Post
+from PIL import Image
+from posts import thumbnails
+from posts.models import Comment, Group, Post, StoredFile
+from posts.storage import post_image_storage
+from posts.templatetags.post_cards import post_cards
+from sorl.thumbnail import default, get_thumbnail
 
 User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -54,10 +65,81 @@ class PostCreateEditFormTest(TestCase):
         self.assertTrue(
             Post.objects.filter(
                 text='Тестовый текст',
-                image='posts/small.gif'
+                image__regex=r'^posts/\w\w/\w\w/\w{64}\.webp$',
+                image_width=2,
+                image_height=1,
             ).exists()
         )
 
+    @override_settings(IMAGE_MAX_SIDE=40)
+    def test_large_image_is_downscaled_without_metadata(self):
+        """Картинка уменьшается и пересохраняется без EXIF."""
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        source = BytesIO()
+        Image.new('RGB', (100, 50), 'red').save(source, 'JPEG', exif=exif)
+        uploaded = SimpleUploadedFile('photo.jpg', source.getvalue(),
+                                      content_type='image/jpeg')
+        self.client.post(reverse('posts:post_edit', args=(self.post.id,)),
+                         {'text': 'С картинкой', 'image': uploaded})
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.image_width, self.post.image_height),
+                         (40, 20))
+        with Image.open(self.post.image.path) as image:
+            self.assertEqual(image.size, (40, 20))
+            self.assertEqual(image.format, 'WEBP')
+            self.assertNotIn('exif', image.info)
+
+    @override_settings(IMAGE_MAX_BYTES=1024)
+    def test_upload_over_byte_limit_is_rejected(self):
+        """Слишком большой файл отбрасывается ещё при приёме."""
+        uploaded = SimpleUploadedFile('big.gif', b'GIF89a' + b'0' * 4096,
+                                      content_type='image/gif')
+        response = self.client.post(reverse('posts:post_create'),
+                                    {'text': 'Большая', 'image': uploaded})
+        self.assertIn('Файл больше',
+                      response.context['form'].errors['image'][0])
+        self.assertFalse(Post.objects.filter(text='Большая').exists())
+
+    @override_settings(IMAGE_MAX_PIXELS=100)
+    def test_image_over_pixel_limit_is_rejected(self):
+        source = BytesIO()
+        Image.new('RGB', (20, 20)).save(source, 'PNG')
+        uploaded = SimpleUploadedFile('wide.png', source.getvalue(),
+                                      content_type='image/png')
+        response = self.client.post(reverse('posts:post_create'),
+                                    {'text': 'Широкая', 'image': uploaded})
+        self.assertFormError(response, 'form', 'image',
+                             'Картинка больше 100 пикселей.')
+
+    def test_animated_image_is_rejected(self):
+        frames = [Image.new('RGB', (4, 4), color) for color in ('red', 'blue')]
+        source = BytesIO()
+        frames[0].save(source, 'GIF', save_all=True,
+                       append_images=frames[1:])
+        uploaded = SimpleUploadedFile('anim.gif', source.getvalue(),
+                                      content_type='image/gif')
+        response = self.client.post(reverse('posts:post_create'),
+                                    {'text': 'Анимация', 'image': uploaded})
+        self.assertFormError(response, 'form', 'image',
+                             'Анимированные картинки не поддерживаются.')
+
+    def test_admin_creates_post(self):
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        self.client.force_login(admin)
+        response = self.client.post(reverse('admin:posts_post_add'), {
+            'text': 'Из админки',
+            'author': self.user.pk,
+            'group': self.group.pk,
+            'image': gif_upload(),
+        })
+        self.assertRedirects(response,
+                             reverse('admin:posts_post_changelist'))
+        post = Post.objects.get(text='Из админки')
+        self.assertEqual((post.author, post.group), (self.user, self.group))
+        self.assertEqual((post.image_width, post.image_height), (1, 1))
+
     def test_edit_post(self):
         """Тест отправки валидной формы при редактировании поста."""
         url = reverse('posts:post_edit', args=(self.post.id,))
@@ -142,3 +224,186 @@ class CommentFormTest(TestCase):
         self.assertRedirects(
             response,
             f'/auth/login/?next=/posts/{self.post.id}/comment/')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(
+            text='Пост с картинкой', author=author,
+            image=SimpleUploadedFile(
+                name='thumb.gif',
+                content=(b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00'
+                         b'\x00\xff\xff\xff!\xf9\x04\x00\x00\x00\x00'
+                         b'\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00'
+                         b'\x02\x02D\x01\x00;'),
+                content_type='image/gif'))
+
+    def test_templates_use_known_kinds(self):
+        """Картинки постов выводятся только через post_image с видами
+        из KINDS, поэтому SIZES покрывает все миниатюры шаблонов."""
+        used = set()
+        for root, _, files in os.walk(settings.TEMPLATES[0]['DIRS'][0]):
+            for name in files:
+                with open(os.path.join(root, name), encoding='utf-8') as f:
+                    source = f.read()
+                self.assertNotIn('{% thumbnail post.image', source)
+                used.update(re.findall(
+                    r"{% post_image post\.image '(\w+)'", source))
+        self.assertEqual(used, set(thumbnails.KINDS))
+
+    def test_card_image_has_srcset_and_lazy_loading(self):
+        card = post_cards([self.post])[0]
+        for geometry in thumbnails.geometries('card'):
+            self.assertIn(' {}w'.format(geometry.split('x')[0]), card)
+        self.assertIn('loading="lazy"', card)
+        self.assertIn('width="960" height="540"', card)
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,)))
+        self.assertContains(response, 'loading="eager"')
+        self.assertContains(response, 'width="960" height="339"')
+
+    def test_command_builds_missing_thumbnails(self):
+        out = StringIO()
+        call_command('pregenerate_thumbnails', workers=1, stdout=out)
+        self.assertIn('Картинок обработано: 1, с ошибками: 0',
+                      out.getvalue())
+        for geometry, options in thumbnails.SIZES:
+            with self.subTest(geometry=geometry):
+                thumbnail = get_thumbnail(self.post.image, geometry,
+                                          **options)
+                self.assertTrue(thumbnail.exists())
+                self.assertEqual(
+                    thumbnails.thumbnail_file(self.post.image, geometry,
+                                              options).name,
+                    thumbnail.name)
+
+    def test_command_walks_posts_in_batches(self):
+        """Посты читаются порциями; картинка из другой порции проходит
+        повторно и находит готовые миниатюры."""
+        Post.objects.create(text='Та же картинка', author=self.post.author,
+                            image=self.post.image.name)
+        out = StringIO()
+        call_command('pregenerate_thumbnails', workers=1, batch_size=1,
+                     stdout=out)
+        self.assertIn('Картинок обработано: 2, с ошибками: 0',
+                      out.getvalue())
+
+    def test_prefetch_keys_match_sorl(self):
+        """Ключи prefetch совпадают с ключами get_thumbnail и считаются
+        без запросов."""
+        for geometry, options in thumbnails.SIZES:
+            with self.subTest(geometry=geometry):
+                with self.assertNumQueries(0):
+                    thumbnail = thumbnails.thumbnail_file(
+                        self.post.image, geometry, options)
+                self.assertEqual(
+                    thumbnail.key,
+                    get_thumbnail(self.post.image, geometry,
+                                  **options).key)
+
+    def test_cards_fetch_thumbnails_in_one_query(self):
+        for text in ('Второй', 'Третий'):
+            Post.objects.create(text=text, author=self.post.author,
+                                image=self.post.image.name)
+        thumbnails.generate(self.post.image.name)
+        posts = list(Post.objects.feed())
+        # Пустой кеш: записи о миниатюрах придётся читать из базы.
+        cache.clear()
+        with self.assertNumQueries(1):
+            cards = post_cards(posts)
+        self.assertEqual(len(cards), 3)
+        self.assertIn('<img', cards[0])
+
+    def test_kvstore_set_and_get_many(self):
+        geometry, options = thumbnails.SIZES[0]
+        thumbnail = get_thumbnail(self.post.image, geometry, **options)
+        default.kvstore.delete(thumbnail, delete_thumbnails=False)
+        self.assertEqual(default.kvstore.get_many([thumbnail]),
+                         {thumbnail.key: None})
+        default.kvstore.set_many([thumbnail])
+        # Повторная запись: SAVEPOINT, DELETE, INSERT и RELEASE
+        # независимо от числа ключей.
+        with self.assertNumQueries(4):
+            default.kvstore.set_many([thumbnail])
+        cache.clear()
+        self.assertEqual(
+            default.kvstore.get_many([thumbnail])[thumbnail.key].name,
+            thumbnail.name)
+
+
+def gif_upload(name='pic.gif'):
+    return SimpleUploadedFile(
+        name, b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff'
+        b'\xff\xff!\xf9\x04\x00\x00\x00\x00\x00,\x00\x00\x00\x00'
+        b'\x01\x00\x01\x00\x00\x02\x02D\x01\x00;',
+        content_type='image/gif')
+
+
+# Вне транзакции теста on_commit срабатывает сразу, и потоки миниатюр
+# писали бы в ту же базу в памяти.
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ContentAddressedStorageTest(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+
+    def test_same_images_are_stored_once(self):
+        first = Post.objects.create(text='Первый', author=self.author,
+                                    image=gif_upload('one.gif'))
+        second = Post.objects.create(text='Второй', author=self.author,
+                                     image=gif_upload('two.gif'))
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        self.assertEqual(StoredFile.objects.get(name=name).ref_count, 2)
+        first.delete()
+        self.assertTrue(post_image_storage.exists(name))
+        second.delete()
+        self.assertFalse(post_image_storage.exists(name))
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_pregenerated_thumbnails_match_templates(self):
+        """Миниатюры пула строятся под теми ключами, что ищут шаблоны:
+        источник берётся из хранилища поля, а не из хранилища
+        по умолчанию."""
+        post = Post.objects.create(text='Пост', author=self.author,
+                                   image=gif_upload())
+        self.assertTrue(thumbnails.generate(post.image.name))
+        files = [thumbnails.thumbnail_file(post.image, geometry, options)
+                 for geometry, options in thumbnails.SIZES]
+        found = default.kvstore.get_many(files)
+        self.assertNotIn(None, found.values())
+
+    def test_archived_copy_keeps_file(self):
+        post = Post.objects.create(text='Старый', author=self.author,
+                                   image=gif_upload())
+        Post.objects.filter(pk=post.pk).update(
+            pub_date=post.pub_date.replace(year=2000))
+        call_command('archive_posts', stdout=StringIO())
+        self.assertTrue(post_image_storage.exists(post.image.name))
+        self.assertEqual(StoredFile.objects.get().ref_count, 1)
+
+    def test_rehash_command_moves_legacy_files(self):
+        legacy = post_image_storage.location + '/posts/legacy.gif'
+        os.makedirs(os.path.dirname(legacy), exist_ok=True)
+        with open(legacy, 'wb') as file:
+            file.write(gif_upload().read())
+        post = Post.objects.create(text='Старый', author=self.author,
+                                   image='posts/legacy.gif')
+        call_command('rehash_images', batch_size=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertRegex(post.image.name, r'^posts/\w\w/\w\w/\w{64}\.gif$')
+        self.assertTrue(post_image_storage.exists(post.image.name))
+        self.assertFalse(os.path.exists(legacy))
+        self.assertEqual(StoredFile.objects.get().ref_count, 1)
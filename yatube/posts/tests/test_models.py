@@ -1,8 +1,14 @@
+import tempfile
+from datetime import datetime, timezone
+from io import StringIO
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
 
-from posts.models import Group, Post
+from posts.models import (ArchivedComment, ArchivedPost, Comment, Follow,
+                          Group, Post, TimelineEntry, UserCounters)
 
 User = get_user_model()
 
@@ -52,3 +58,99 @@ class PostModelTest(TestCase):
                 self.assertEqual(
                     post._meta.get_field(field).help_text,
                     expected_help_text)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def counters(self, user):
+        return UserCounters.objects.get(user=user)
+
+    def test_counters_follow_changes(self):
+        """Счётчики меняются при создании и удалении объектов."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        comment = Comment.objects.create(post=post, author=self.reader,
+                                         text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(self.counters(self.author).post_count, 1)
+        self.assertEqual(self.counters(self.author).follower_count, 1)
+        self.assertEqual(self.counters(self.reader).following_count, 1)
+        self.assertEqual(post.comment_count, 1)
+
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+        self.assertEqual(self.counters(self.author).follower_count, 0)
+        self.assertEqual(self.counters(self.reader).following_count, 0)
+        post.delete()
+        self.assertEqual(self.counters(self.author).post_count, 0)
+
+    def test_repair_counters(self):
+        """repair_counters пересчитывает разъехавшиеся счётчики."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        UserCounters.objects.filter(user=self.author).update(post_count=7)
+        UserCounters.objects.filter(user=self.reader).delete()
+        Post.objects.filter(pk=post.pk).update(comment_count=5)
+
+        out = StringIO()
+        call_command('repair_counters', chunk_size=1, stdout=out)
+
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.counters(self.author).post_count, 1)
+        self.assertEqual(self.counters(self.reader).post_count, 0)
+        self.assertIn('пользователей 2, постов 1', out.getvalue())
+
+
+class TransferTest(TestCase):
+    def test_export_import_round_trip(self):
+        """Выгрузка и загрузка сохраняют связи и даты публикации,
+        а старые посты сразу попадают в архив."""
+        past = datetime(2020, 1, 2, 3, 4, 5, 123456, tzinfo=timezone.utc)
+        author = User.objects.create_user(username='author')
+        reader = User.objects.create_user(username='reader')
+        group = Group.objects.create(title='Группа', slug='group',
+                                     description='Описание')
+        old = Post.objects.create(author=author, group=group,
+                                  text='Старый пост')
+        comment = Comment.objects.create(post=old, author=reader,
+                                         text='Комментарий')
+        Post.objects.filter(pk=old.pk).update(pub_date=past)
+        Comment.objects.filter(pk=comment.pk).update(created=past)
+        fresh = Post.objects.create(author=author, text='Новый пост')
+        fresh_date = fresh.pub_date
+        Follow.objects.create(user=reader, author=author)
+
+        with tempfile.NamedTemporaryFile('w+', suffix='.jsonl') as dump:
+            call_command('export_jsonl', dump.name, stderr=StringIO())
+            User.objects.all().delete()
+            Group.objects.all().delete()
+            out = StringIO()
+            call_command('import_jsonl', dump.name, batch_size=1, stdout=out)
+
+        old = ArchivedPost.objects.get()
+        self.assertEqual((old.author.username, old.group.slug,
+                          old.pub_date, old.comment_count),
+                         ('author', 'group', past, 1))
+        comment = ArchivedComment.objects.get()
+        self.assertEqual((comment.post, comment.author.username,
+                          comment.created), (old, 'reader', past))
+        fresh = Post.objects.get()
+        self.assertEqual((fresh.text, fresh.pub_date),
+                         ('Новый пост', fresh_date))
+        self.assertFalse(Comment.objects.exists())
+        reader = User.objects.get(username='reader')
+        self.assertTrue(Follow.objects.filter(
+            user=reader, author=fresh.author).exists())
+        self.assertEqual(
+            list(TimelineEntry.objects.filter(user=reader).values_list(
+                'post_id', flat=True)), [fresh.pk])
+        self.assertEqual(fresh.author.counters.post_count, 2)
+        self.assertIn('post: 2', out.getvalue())
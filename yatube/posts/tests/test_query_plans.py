@@ -0,0 +1,126 @@
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.utils import encode_cursor
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# Планы, которые проверены и оставлены сознательно.
+ALLOWED_PLANS = (
+    # Таблица pull-авторов читается целиком и кешируется, см. feed.py.
+    ('SCAN posts_pullauthor', 'posts_pullauthor'),
+    # Выпадающий список групп в форме поста показывает их все.
+    ('SCAN posts_group', 'FROM "posts_group"'),
+    # Лента подписок ограничена TIMELINE_SIZE записями читателя,
+    # поэтому сортировка в памяти не растёт вместе с таблицей постов.
+    ('USE TEMP B-TREE FOR ORDER BY', 'posts_timelineentry'),
+)
+
+
+def bad_steps(sql):
+    """Шаги плана с полным обходом таблицы или сортировкой в памяти."""
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        plan = [row[-1] for row in cursor.fetchall()]
+    bad = []
+    for step in plan:
+        if not ((step.startswith('SCAN') and 'USING' not in step)
+                or 'TEMP B-TREE' in step):
+            continue
+        if any(step.startswith(allowed) and table in sql
+               for allowed, table in ALLOWED_PLANS):
+            continue
+        bad.append(step)
+    return bad
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN есть в SQLite')
+class QueryPlanTest(TestCase):
+    """Запросы всех view из posts/views.py идут по индексам."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='reader')
+        cls.author = User.objects.create(username='author')
+        cls.other = User.objects.create(username='other')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        for i in range(15):
+            cls.post = Post.objects.create(text=f'Пост {i}',
+                                           author=cls.author,
+                                           group=cls.group)
+        cls.comment = Comment.objects.create(post=cls.post, author=cls.user,
+                                             text='Комментарий')
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.author)
+
+    def assert_plans(self, method, url, data=None):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            getattr(self.client, method)(url, data)
+        for query in queries.captured_queries:
+            sql = query['sql']
+            # Статистику планировщика читает EstimatedCountPaginator.
+            if not sql.startswith('SELECT') or 'sqlite_stat1' in sql:
+                continue
+            with self.subTest(url=url, sql=sql):
+                self.assertEqual(bad_steps(sql), [])
+
+    def test_read_views(self):
+        cursor = {'cursor': encode_cursor(self.post.pub_date, self.post.pk,
+                                          'next')}
+        pages = (
+            (reverse('posts:index'), None),
+            (reverse('posts:index'), cursor),
+            (reverse('posts:index'), {'page': 2}),
+            (reverse('posts:group_list', args=('group',)), None),
+            (reverse('posts:group_list', args=('group',)), cursor),
+            (reverse('posts:profile', args=('author',)), None),
+            (reverse('posts:profile', args=('author',)), cursor),
+            (reverse('posts:post_detail', args=(self.post.pk,)), None),
+            (reverse('posts:comment_list', args=(self.post.pk,)), {
+                'cursor': encode_cursor(self.comment.created,
+                                        self.comment.pk, 'next')}),
+            (reverse('api:post_list'), cursor),
+            (reverse('api:group_post_list', args=('group',)), cursor),
+            (reverse('api:profile_post_list', args=('author',)), cursor),
+            (reverse('api:post_detail', args=(self.post.pk,)), None),
+            (reverse('api:comment_list', args=(self.post.pk,)), None),
+            (reverse('api:profile_detail', args=('author',)), None),
+            (reverse('posts:post_create'), None),
+            (reverse('posts:post_edit', args=(self.post.pk,)), None),
+        )
+        for url, data in pages:
+            self.assert_plans('get', url, data)
+
+    def test_follow_views(self):
+        self.client.force_login(self.user)
+        self.assert_plans('get', reverse('posts:follow_index'))
+        self.assert_plans('get', reverse('posts:follow_index'), {
+            'cursor': encode_cursor(self.post.pub_date, self.post.pk, 'next')
+        })
+        self.assert_plans('get', reverse('posts:profile_follow',
+                                         args=('other',)))
+        self.assert_plans('get', reverse('posts:profile_unfollow',
+                                         args=('other',)))
+
+    def test_write_views(self):
+        self.assert_plans('post', reverse('posts:post_create'),
+                          {'text': 'Новый пост', 'group': self.group.pk})
+        self.assert_plans('post', reverse('posts:post_edit',
+                                          args=(self.post.pk,)),
+                          {'text': 'Исправленный пост'})
+        self.assert_plans('post', reverse('posts:add_comment',
+                                          args=(self.post.pk,)),
+                          {'text': 'Ещё комментарий'})
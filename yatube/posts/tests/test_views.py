@@ -1,10 +1,24 @@
+import csv
+import json
+from datetime import timedelta
+from http import HTTPStatus
+from io import StringIO
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.test import Client, TestCase
+from django.core.management import call_command
+from django.db import DatabaseError, transaction
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
-from posts.models import Follow, Group, Post
+from core.cache import generations
+from core.testing import run_on_commit
+from posts import archive, feed, follow_graph
+from posts.models import (ArchivedComment, ArchivedPost, Comment, Follow,
+                          Group, Post, PullAuthor, TimelineEntry)
+from posts.templatetags.post_cards import post_cards
 
 User = get_user_model()
 
@@ -113,17 +127,57 @@ class PostsViewsTests(TestCase):
         self.assertEqual(len(response.context['page_obj']),
                          expected_records_on_second_page)
 
+    def test_cursor_pages(self):
+        """Курсорный пагинатор листает ленту вперёд и назад."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        ]
+        expected = list(Post.objects.order_by('-pub_date', '-pk'))
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                first_page = self.client.get(url).context['page_obj']
+                self.assertEqual(list(first_page),
+                                 expected[:settings.PAGE_SIZE])
+                self.assertFalse(first_page.has_previous())
+                self.assertTrue(first_page.has_next())
+
+                second_page = self.client.get(
+                    url, {'cursor': first_page.next_cursor()}
+                ).context['page_obj']
+                self.assertEqual(list(second_page),
+                                 expected[settings.PAGE_SIZE:])
+                self.assertFalse(second_page.has_next())
+
+                previous_page = self.client.get(
+                    url, {'cursor': second_page.previous_cursor()}
+                ).context['page_obj']
+                self.assertEqual(list(previous_page),
+                                 expected[:settings.PAGE_SIZE])
+                self.assertFalse(previous_page.has_previous())
+
+    def test_broken_cursor_shows_first_page(self):
+        """Испорченный курсор открывает первую страницу."""
+        response = self.client.get(reverse('posts:index'),
+                                   {'cursor': 'not-a-cursor'})
+        self.assertEqual(len(response.context['page_obj']),
+                         settings.PAGE_SIZE)
+
 
 class CacheTestCase(TestCase):
     @classmethod
     def setUpClass(self):
         super().setUpClass()
-        self.group = Group.objects.create(title='Test group',
-                                          slug='test-group')
-        self.user = get_user_model().objects.create_user(username='testuser')
-        self.post = Post.objects.create(text='test text',
-                                        group=self.group,
-                                        author=self.user)
+        with run_on_commit():
+            self.group = Group.objects.create(title='Test group',
+                                              slug='test-group')
+            self.user = get_user_model().objects.create_user(
+                username='testuser')
+            self.post = Post.objects.create(text='test text',
+                                            group=self.group,
+                                            author=self.user)
 
     def test_cache_local(self):
         """Тест кеширования главной страницы."""
@@ -135,12 +189,195 @@ class CacheTestCase(TestCase):
         cache.clear()
         response = self.client.get('/')
         self.assertContains(response, 'test text')
-        self.post.delete()
+        # update() не отправляет сигналов: страница остаётся в кеше.
+        Post.objects.filter(pk=self.post.pk).update(text='changed text')
         response = self.client.get('/')
         self.assertContains(response, 'test text')
         cache.clear()
         response = self.client.get('/')
-        self.assertNotContains(response, 'test text')
+        self.assertContains(response, 'changed text')
+
+    def test_cache_is_invalidated_by_changes(self):
+        """Изменение поста сразу сбрасывает кеш его страниц."""
+        cache.clear()
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        )
+        for url in urls:
+            self.assertContains(self.client.get(url), 'test text')
+        with run_on_commit():
+            post = Post.objects.create(text='fresh text', group=self.group,
+                                       author=self.user)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), 'fresh text')
+        with run_on_commit():
+            post.delete()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertNotContains(self.client.get(url), 'fresh text')
+
+    def test_post_cards_are_cached(self):
+        """Карточка поста рисуется один раз и обновляется после правки."""
+        cache.clear()
+        post = Post.objects.feed().get(pk=self.post.pk)
+        self.assertIn('test text', post_cards([post])[0])
+        Post.objects.filter(pk=post.pk).update(text='silent change')
+        with self.assertTemplateNotUsed('posts/includes/post_card.html'):
+            self.assertIn('test text', post_cards([post])[0])
+        post = Post.objects.get(pk=post.pk)
+        post.save()
+        self.assertIn('silent change', post_cards([post])[0])
+
+    def test_post_card_follows_author_rename(self):
+        """Новое имя и username автора сразу видны в карточке."""
+        cache.clear()
+        post = Post.objects.feed().get(pk=self.post.pk)
+        self.assertIn('/profile/testuser/', post_cards([post])[0])
+        User.objects.filter(pk=self.user.pk).update(
+            username='renamed', first_name='Иван')
+        post = Post.objects.feed().get(pk=self.post.pk)
+        card = post_cards([post])[0]
+        self.assertIn('/profile/renamed/', card)
+        self.assertIn('Иван', card)
+
+    def test_generations_change_after_commit(self):
+        """Поколения меняются после фиксации, откат их не трогает."""
+        cache.clear()
+        self.assertContains(self.client.get('/'), 'test text')
+        before = generations('posts')
+        with self.assertRaises(DatabaseError):
+            with transaction.atomic():
+                Post.objects.create(text='lost text', author=self.user)
+                self.assertEqual(generations('posts'), before)
+                # Своё незафиксированное изменение видно сразу.
+                self.assertContains(self.client.get('/'), 'lost text')
+                raise DatabaseError
+        self.assertEqual(generations('posts'), before)
+        self.assertNotContains(self.client.get('/'), 'lost text')
+        with run_on_commit():
+            Post.objects.create(text='kept text', author=self.user)
+        self.assertNotEqual(generations('posts'), before)
+
+    def test_group_change_invalidates_cache(self):
+        """Переименование группы сбрасывает кеш страниц с её ссылками."""
+        cache.clear()
+        self.assertContains(self.client.get('/'), '/group/test-group/')
+        self.group.slug = 'new-slug'
+        with run_on_commit():
+            self.group.save()
+        self.assertContains(self.client.get('/'), '/group/new-slug/')
+
+
+class SharedPageCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with run_on_commit():
+            cls.author = User.objects.create_user(username='author')
+            cls.follower = User.objects.create_user(username='follower')
+            cls.stranger = User.objects.create_user(username='stranger')
+            Follow.objects.create(user=cls.follower, author=cls.author)
+            Post.objects.create(text='shared text', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.follower_client = Client()
+        self.follower_client.force_login(self.follower)
+        self.stranger_client = Client()
+        self.stranger_client.force_login(self.stranger)
+
+    def test_logged_in_users_hit_shared_cache(self):
+        """Залогиненные получают общую страницу со своей шапкой."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertTemplateUsed(response, 'posts/index.html')
+        self.assertContains(response, 'Войти')
+
+        response = self.follower_client.get(reverse('posts:index'))
+        self.assertTemplateNotUsed(response, 'posts/index.html')
+        self.assertContains(response, 'shared text')
+        self.assertContains(response, 'Пользователь: follower')
+        self.assertContains(response, 'Избранные авторы')
+        self.assertNotContains(response, 'Войти')
+        self.assertNotContains(response, '<!--hole:')
+
+    def test_follow_button_is_filled_per_user(self):
+        """Кнопка подписки в кешированном профиле своя у каждого."""
+        url = reverse('posts:profile', kwargs={'username': 'author'})
+        self.assertContains(self.client.get(url), 'Подписаться')
+
+        response = self.follower_client.get(url)
+        self.assertTemplateNotUsed(response, 'posts/profile.html')
+        self.assertContains(response, 'Отписаться')
+        self.assertNotContains(response, 'Подписаться')
+
+        response = self.stranger_client.get(url)
+        self.assertTemplateNotUsed(response, 'posts/profile.html')
+        self.assertContains(response, 'Подписаться')
+        self.assertNotContains(response, 'Отписаться')
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with run_on_commit():
+            cls.author = User.objects.create_user(username='author')
+            cls.group = Group.objects.create(title='Группа', slug='group',
+                                             description='Описание')
+            cls.post = Post.objects.create(text='Пост', author=cls.author,
+                                           group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def assertNotModified(self, url, etag, client=None):
+        client = client or self.client
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_unchanged_pages_are_not_modified(self):
+        """Неизменённые страницы отдаются ответом 304."""
+        urls = (
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                self.assertNotModified(url, etag)
+                response = self.author_client.get(url,
+                                                  HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_changes_update_validator(self):
+        """Новый пост или комментарий меняет ETag страницы."""
+        group_url = reverse('posts:group_list',
+                            kwargs={'slug': self.group.slug})
+        detail_url = reverse('posts:post_detail',
+                             kwargs={'post_id': self.post.pk})
+        group_etag = self.client.get(group_url)['ETag']
+        detail_etag = self.client.get(detail_url)['ETag']
+
+        with run_on_commit():
+            Post.objects.create(text='Новый пост', author=self.author,
+                                group=self.group)
+        response = self.client.get(group_url, HTTP_IF_NONE_MATCH=group_etag)
+        self.assertContains(response, 'Новый пост')
+
+        with run_on_commit():
+            self.author_client.post(
+                reverse('posts:add_comment',
+                        kwargs={'post_id': self.post.pk}),
+                {'text': 'Комментарий'})
+        response = self.client.get(detail_url,
+                                   HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertContains(response, 'Комментарий')
 
 
 '''class TestFollow(TestCase):
@@ -180,6 +417,8 @@ class CacheTestCase(TestCase):
 
 class FollowTest(TestCase):
     def setUp(self):
+        # Граф подписок кешируется по id, а id повторяются между тестами.
+        cache.clear()
         self.client = Client()
         self.user1 = User.objects.create_user(username='user1',
                                               password='password')
@@ -211,3 +450,410 @@ class FollowTest(TestCase):
                                                author=self.user2).exists())
         response = self.client.get('/follow/')
         self.assertNotContains(response, self.post.text)
+
+    def test_follow_graph_is_updated_in_place(self):
+        """Граф подписок меняется вместе с подпиской без чтения базы."""
+        user3 = User.objects.create_user(username='user3')
+        self.assertFalse(follow_graph.follows(self.user1.pk, self.user2.pk))
+        with run_on_commit():
+            self.client.get(f'/profile/{self.user2.username}/follow/')
+            self.client.get(f'/profile/{user3.username}/follow/')
+        with self.assertNumQueries(0):
+            self.assertTrue(
+                follow_graph.follows(self.user1.pk, self.user2.pk))
+            self.assertEqual(
+                follow_graph.followed_among(
+                    self.user1.pk, [self.user1.pk, self.user2.pk, user3.pk]),
+                {self.user2.pk, user3.pk})
+        with run_on_commit():
+            self.client.get(f'/profile/{self.user2.username}/unfollow/')
+        with self.assertNumQueries(0):
+            self.assertEqual(list(follow_graph.following(self.user1.pk)),
+                             [user3.pk])
+        response = self.client.get(f'/profile/{user3.username}/')
+        self.assertContains(response, 'Отписаться')
+
+    def test_rolled_back_follow_keeps_graph(self):
+        """Откаченная подписка не попадает в граф в кеше."""
+        self.assertFalse(follow_graph.follows(self.user1.pk, self.user2.pk))
+        with self.assertRaises(DatabaseError):
+            with transaction.atomic():
+                Follow.objects.create(user=self.user1, author=self.user2)
+                # Своя подписка видна до фиксации.
+                self.assertTrue(
+                    follow_graph.follows(self.user1.pk, self.user2.pk))
+                raise DatabaseError
+        with self.assertNumQueries(0):
+            self.assertFalse(
+                follow_graph.follows(self.user1.pk, self.user2.pk))
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новый пост автора попадает в ленту подписчика."""
+        self.client.get(f'/profile/{self.user2.username}/follow/')
+        new_post = Post.objects.create(text='fresh post', author=self.user2)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user1, post=new_post).exists())
+        response = self.client.get('/follow/')
+        self.assertIn(new_post, response.context['page_obj'])
+
+    @override_settings(TIMELINE_SIZE=2)
+    def test_timeline_is_trimmed(self):
+        """В ленте хранится не больше TIMELINE_SIZE записей."""
+        for i in range(3):
+            Post.objects.create(text=f'old post {i}', author=self.user2)
+        self.client.get(f'/profile/{self.user2.username}/follow/')
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user1).count(), 2)
+        Post.objects.create(text='new post', author=self.user2)
+        # Раскладка не подрезает ленту, это делает команда.
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user1).count(), 3)
+        out = StringIO()
+        call_command('trim_timelines', stdout=out)
+        self.assertIn('Подрезано лент: 1', out.getvalue())
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user1).count(), 2)
+        Post.objects.create(text='newer post', author=self.user2)
+        response = self.client.get('/follow/')
+        self.assertEqual(len(response.context['page_obj']), 2)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user1).count(), 2)
+
+
+@override_settings(FEED_PULL_THRESHOLD=2)
+class HybridFeedTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.star = User.objects.create_user(username='star')
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.fan = User.objects.create_user(username='fan')
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.fan_client = Client()
+        self.fan_client.force_login(self.fan)
+
+    def follow(self, client, author):
+        client.get(reverse('posts:profile_follow',
+                           kwargs={'username': author.username}))
+
+    def test_popular_author_is_pulled(self):
+        """Посты популярного автора подмешиваются при чтении ленты."""
+        self.follow(self.reader_client, self.star)
+        self.follow(self.fan_client, self.star)
+        self.follow(self.reader_client, self.author)
+        self.assertTrue(PullAuthor.objects.filter(author=self.star).exists())
+
+        star_post = Post.objects.create(text='star post', author=self.star)
+        author_post = Post.objects.create(text='author post',
+                                          author=self.author)
+        self.assertFalse(
+            TimelineEntry.objects.filter(post=star_post).exists())
+        self.assertTrue(
+            TimelineEntry.objects.filter(post=author_post).exists())
+
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']),
+                         [author_post, star_post])
+        self.assertEqual(feed.stats()['hybrid'], 1)
+        self.assertEqual(feed.stats()['fan_out_skipped'], 1)
+
+        response = self.fan_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [star_post])
+        self.assertEqual(feed.stats()['pull'], 1)
+
+    def test_hybrid_feed_cursor_pages(self):
+        """Страницы гибридной ленты не теряют и не повторяют посты."""
+        self.follow(self.reader_client, self.star)
+        self.follow(self.fan_client, self.star)
+        self.follow(self.reader_client, self.author)
+        for i in range(7):
+            Post.objects.create(text=f'star {i}', author=self.star)
+            Post.objects.create(text=f'author {i}', author=self.author)
+        expected = list(Post.objects.order_by('-pub_date', '-pk'))
+
+        url = reverse('posts:follow_index')
+        first_page = self.reader_client.get(url).context['page_obj']
+        second_page = self.reader_client.get(
+            url, {'cursor': first_page.next_cursor()}).context['page_obj']
+        self.assertEqual(list(first_page) + list(second_page), expected)
+        old_page = self.reader_client.get(url, {'page': 2})
+        self.assertEqual(list(old_page.context['page_obj']),
+                         expected[settings.PAGE_SIZE:])
+
+
+class FeedQueryCountTest(TestCase):
+    """Число запросов на страницу ленты не зависит от числа постов."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group',
+                                         description='Описание')
+        cls.author = User.objects.create_user(username='author',
+                                              first_name='Имя',
+                                              last_name='Фамилия')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(settings.PAGE_SIZE):
+            author = User.objects.create_user(username=f'author{i}')
+            Follow.objects.create(user=cls.reader, author=author)
+            Post.objects.create(text=f'Пост {i}', author=author,
+                                group=cls.group)
+            Post.objects.create(text=f'Пост автора {i}', author=cls.author,
+                                group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_feed_query_count(self):
+        """Карточки постов не делают запросов за автором и группой."""
+        pages = (
+            (self.client, reverse('posts:index'), 1),
+            (self.client, reverse('posts:group_list',
+                                  kwargs={'slug': self.group.slug}), 2),
+            # Горячие посты автора кончаются ровно на первой странице,
+            # поэтому пагинатор заглядывает ещё и в архив.
+            (self.client, reverse('posts:profile',
+                                  kwargs={'username': 'author'}), 3),
+            (self.reader_client, reverse('posts:follow_index'), 6),
+        )
+        for client, url, queries in pages:
+            with self.subTest(url=url):
+                with self.assertNumQueries(queries):
+                    response = client.get(url)
+                self.assertEqual(len(response.context['page_obj']),
+                                 settings.PAGE_SIZE)
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create_user(username='author')
+        self.weak = Post.objects.create(
+            text='Кошки и собаки живут во дворе вместе с людьми',
+            author=author)
+        self.strong = Post.objects.create(text='Кошки, кошки и снова кошки',
+                                          author=author)
+        Post.objects.create(text='Только собаки', author=author)
+
+    def found(self, query):
+        response = self.client.get(reverse('posts:search'), {'q': query})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return list(response.context['page_obj'])
+
+    def test_results_are_ranked(self):
+        self.assertEqual(self.found('кошки'), [self.strong, self.weak])
+        self.assertEqual(self.found('кошк'), [self.strong, self.weak])
+        self.assertEqual(self.found('кошки собаки'), [self.weak])
+
+    def test_fts_syntax_is_ignored(self):
+        for query in ('"кошки', 'кошки AND (', 'NEAR(*', '   ', ''):
+            with self.subTest(query=query):
+                self.found(query)
+
+    def test_index_follows_saves_and_deletes(self):
+        self.weak.text = 'Теперь здесь про попугаев'
+        self.weak.save()
+        self.assertEqual(self.found('попугаев'), [self.weak])
+        self.assertEqual(self.found('кошки'), [self.strong])
+        self.strong.delete()
+        self.assertEqual(self.found('кошки'), [])
+
+    def test_rebuild_command(self):
+        Post.objects.filter(pk=self.weak.pk).update(text='Про хомяков')
+        self.assertEqual(self.found('хомяков'), [])
+        call_command('rebuild_search_index', batch_size=1,
+                     stdout=StringIO())
+        cache.clear()
+        self.assertEqual(self.found('хомяков'), [self.weak])
+
+    @override_settings(PAGE_SIZE=1)
+    def test_pages_keep_query(self):
+        response = self.client.get(reverse('posts:search'), {'q': 'кошки'})
+        self.assertContains(response, '?q=%D0%BA%D0%BE%D1%88%D0%BA%D0%B8'
+                                      '&amp;page=2')
+
+
+@override_settings(PAGE_SIZE=2, ARCHIVE_AFTER_DAYS=30)
+class ArchiveTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.group = Group.objects.create(title='Группа', slug='group',
+                                          description='Описание')
+        self.posts = [
+            Post.objects.create(text=f'Пост {i}', author=self.author,
+                                group=self.group)
+            for i in range(5)
+        ]
+        self.old = self.posts[:3]
+        Comment.objects.create(post=self.old[0], author=self.author,
+                               text='Старый комментарий')
+        Post.objects.filter(pk__in=[post.pk for post in self.old]).update(
+            pub_date=timezone.now() - timedelta(days=60))
+        call_command('archive_posts', batch_size=2, stdout=StringIO())
+        self.client.force_login(self.author)
+
+    def test_old_posts_are_moved(self):
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(
+            set(ArchivedPost.objects.values_list('pk', flat=True)),
+            {post.pk for post in self.old})
+        self.assertEqual(ArchivedComment.objects.get().post_id,
+                         self.old[0].pk)
+        self.assertEqual(self.author.counters.post_count, 5)
+
+    def test_batches_go_from_oldest(self):
+        """Пост с большим pk, но старой датой уходит в первой партии."""
+        young = Post.objects.create(text='Молодой', author=self.author)
+        oldest = Post.objects.create(text='Старейший', author=self.author)
+        Post.objects.filter(pk=young.pk).update(
+            pub_date=timezone.now() - timedelta(days=40))
+        Post.objects.filter(pk=oldest.pk).update(
+            pub_date=timezone.now() - timedelta(days=90))
+        archive.archive_batch(archive.cutoff(), 1)
+        self.assertTrue(ArchivedPost.objects.filter(pk=oldest.pk).exists())
+        self.assertTrue(Post.objects.filter(pk=young.pk).exists())
+
+    def test_feeds_continue_into_archive(self):
+        for url in (reverse('posts:profile', args=('author',)),
+                    reverse('posts:group_list', args=('group',))):
+            with self.subTest(url=url):
+                seen = []
+                page = self.client.get(url).context['page_obj']
+                while True:
+                    seen.extend(post.pk for post in page)
+                    if not page.has_next():
+                        break
+                    page = self.client.get(
+                        url, {'cursor': page.next_cursor()}
+                    ).context['page_obj']
+                self.assertEqual(seen,
+                                 [post.pk for post in reversed(self.posts)])
+                # Назад из архива в горячую таблицу.
+                page = self.client.get(
+                    url, {'cursor': page.previous_cursor()}
+                ).context['page_obj']
+                self.assertEqual([post.pk for post in page], seen[2:4])
+
+    def test_legacy_page_numbers_cover_archive(self):
+        """Старые ссылки ?page=N идут по (-pub_date, -pk) без повторов."""
+        url = reverse('posts:profile', args=('author',))
+        seen = []
+        for number in (1, 2, 3):
+            page = self.client.get(url, {'page': number}).context['page_obj']
+            seen.extend(post.pk for post in page)
+        self.assertEqual(seen, [post.pk for post in reversed(self.posts)])
+
+    def test_archived_post_page(self):
+        post = self.old[0]
+        response = self.client.get(
+            reverse('posts:post_detail', args=(post.pk,)))
+        self.assertContains(response, 'Старый комментарий')
+        self.assertNotContains(
+            response, reverse('posts:post_edit', args=(post.pk,)))
+        self.assertNotContains(
+            response, reverse('posts:add_comment', args=(post.pk,)))
+        response = self.client.get(
+            reverse('posts:post_edit', args=(post.pk,)))
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+@override_settings(COMMENTS_PAGE_SIZE=2)
+class CommentPageTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(text='Пост', author=self.author)
+        self.comments = [
+            Comment.objects.create(post=self.post, author=self.author,
+                                   text=f'Комментарий {i}')
+            for i in range(5)
+        ]
+
+    def test_comments_are_loaded_by_pages(self):
+        page = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,))
+        ).context['comments']
+        url = reverse('posts:comment_list', args=(self.post.pk,))
+        seen = []
+        while True:
+            seen.extend(comment.pk for comment in page)
+            if not page.has_next():
+                break
+            response = self.client.get(url, {'cursor': page.next_cursor()})
+            page = response.context['comments']
+        self.assertEqual(seen,
+                         [comment.pk for comment in reversed(self.comments)])
+        self.assertNotContains(response, 'data-more-comments')
+
+    def test_comment_page_queries(self):
+        url = reverse('posts:comment_list', args=(self.post.pk,))
+        # Пост, генерации для ETag и комментарии с авторами.
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertContains(response, 'data-more-comments')
+        self.assertContains(response, 'author')
+
+
+@override_settings(EXPORT_CHUNK_SIZE=2)
+class ProfileExportTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.group = Group.objects.create(title='Группа', slug='group',
+                                          description='Описание')
+        self.posts = [
+            Post.objects.create(text=f'Пост {i}, с запятой',
+                                author=self.author, group=self.group)
+            for i in range(5)
+        ]
+        Post.objects.filter(pk=self.posts[0].pk).update(
+            pub_date=timezone.now() - timedelta(days=400))
+        call_command('archive_posts', stdout=StringIO())
+        self.url = reverse('posts:profile_export', args=('author',))
+        self.client.force_login(self.author)
+
+    def read(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export_includes_archive(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.reader(StringIO(self.read(response))))
+        self.assertEqual(rows[0], ['text', 'group', 'pub_date', 'image'])
+        self.assertEqual([row[0] for row in rows[1:]],
+                         [post.text for post in reversed(self.posts)])
+        self.assertEqual(rows[1][1], 'group')
+
+    def test_jsonl_export(self):
+        response = self.client.get(self.url, {'format': 'jsonl'})
+        lines = self.read(response).splitlines()
+        self.assertEqual(len(lines), len(self.posts))
+        self.assertEqual(json.loads(lines[0]),
+                         {'text': self.posts[-1].text, 'group': 'group',
+                          'pub_date': self.posts[-1].pub_date.isoformat(),
+                          'image': None})
+
+    def test_only_author_can_export(self):
+        self.assertContains(self.client.get(
+            reverse('posts:profile', args=('author',))), self.url)
+        other = User.objects.create_user(username='other')
+        self.client.force_login(other)
+        self.assertRedirects(
+            self.client.get(self.url),
+            reverse('posts:profile', args=('author',)))
+        self.assertNotContains(self.client.get(
+            reverse('posts:profile', args=('author',))), self.url)
+        self.assertEqual(
+            self.client.get(self.url.replace('author', 'other'),
+                            {'format': 'xml'}).status_code,
+            HTTPStatus.NOT_FOUND)
@@ -0,0 +1,105 @@
+"""Миниатюры постов.
+
+Шаблоны выводят картинку поста тегом {% post_image %}: для вида
+картинки из KINDS строятся миниатюры всех ширин WIDTHS, и браузер
+выбирает нужную по srcset. Для нового или изменённого поста с картинкой
+миниатюры строятся в пуле потоков после коммита, и страница находит их
+в хранилище sorl уже готовыми. Ленты перед отрисовкой карточек достают
+записи о миниатюрах всех постов страницы одним запросом (prefetch).
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.images import ImageFile
+
+from .storage import post_image_storage
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = (480, 720, 960)
+OPTIONS = {'crop': 'center', 'upscale': True}
+# Вид картинки: пропорции (ширина, высота) и атрибут sizes — какую
+# ширину картинка занимает в вёрстке.
+KINDS = {
+    'card': ((16, 9), '(max-width: 992px) 100vw, 960px'),
+    'detail': ((960, 339), '(min-width: 768px) 75vw, 100vw'),
+}
+
+
+def geometries(kind):
+    """Размеры миниатюр вида kind от узкой к широкой."""
+    (width, height), _ = KINDS[kind]
+    return [f'{size}x{round(size * height / width)}' for size in WIDTHS]
+
+
+SIZES = tuple((geometry, OPTIONS) for kind in KINDS
+              for geometry in geometries(kind))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails')
+    return _executor
+
+
+def generate(name):
+    """Строит недостающие миниатюры картинки name всех размеров.
+
+    Возвращает False, если построить не удалось.
+    """
+    try:
+        # Источник с тем же хранилищем, что у поля, иначе у миниатюры
+        # получится другой ключ, чем в шаблоне.
+        source = ImageFile(name, post_image_storage)
+        for geometry, options in SIZES:
+            get_thumbnail(source, geometry, **options)
+    except Exception:
+        logger.exception('Не удалось построить миниатюры %s', name)
+        return False
+    return True
+
+
+def generate_in_worker(name):
+    try:
+        return generate(name)
+    finally:
+        # Потоки пула живут долго, соединение закрывается так же,
+        # как после запроса.
+        close_old_connections()
+
+
+def thumbnail_file(image, geometry, options):
+    """Миниатюра, которую вернул бы get_thumbnail, без обращений.
+
+    Имя считает сам sorl: в режиме dry_run хранилище ключей отвечает
+    на первый же запрос get_thumbnail самой запрошенной миниатюрой.
+    """
+    with default.kvstore.dry_run():
+        return default.backend.get_thumbnail(image, geometry, **options)
+
+
+def prefetch(posts, kind='card'):
+    """Контекст, в котором миниатюры постов берутся из одного запроса."""
+    return default.kvstore.prefetched([
+        thumbnail_file(post.image, geometry, OPTIONS)
+        for post in posts if post.image
+        for geometry in geometries(kind)
+    ])
+
+
+def schedule(name):
+    """Ставит миниатюры картинки name в очередь пула после коммита."""
+    if settings.THUMBNAIL_WORKERS:
+        transaction.on_commit(
+            lambda: _pool().submit(generate_in_worker, name))
@@ -0,0 +1,73 @@
+"""Перенос постов, комментариев, подписок, групп и пользователей в JSONL.
+
+Каждая строка файла — объект {"model": ..., "id": ..., "fields": {...}},
+где внешние ключи хранят id из исходной базы. Модели выгружаются
+в порядке зависимостей, поэтому при загрузке ссылки всегда указывают
+на уже загруженные строки и переводятся в новые id.
+"""
+import json
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# (метка, модель, поля, внешние ключи с метками моделей, на которые они
+# ссылаются, естественный ключ для сопоставления с уже существующими).
+MODELS = (
+    ('user', User,
+     ('username', 'first_name', 'last_name', 'email', 'password',
+      'is_active', 'date_joined'),
+     {}, 'username'),
+    ('group', Group, ('title', 'slug', 'description'), {}, 'slug'),
+    ('post', Post,
+     ('text', 'pub_date', 'modified', 'author', 'group', 'image',
+      'image_width', 'image_height'),
+     {'author': 'user', 'group': 'group'}, None),
+    ('comment', Comment, ('post', 'author', 'text', 'created'),
+     {'post': 'post', 'author': 'user'}, None),
+    ('follow', Follow, ('user', 'author'),
+     {'user': 'user', 'author': 'user'}, None),
+)
+
+
+class TransferEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder без округления дат до миллисекунд."""
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def export_lines(chunk_size):
+    """Строки JSONL со всеми данными; в памяти только одна порция."""
+    for label, model, fields, _, _ in MODELS:
+        rows = model.objects.order_by('pk').values('pk', *fields)
+        for row in rows.iterator(chunk_size=chunk_size):
+            pk = row.pop('pk')
+            yield label, json.dumps(
+                {'model': label, 'id': pk, 'fields': row},
+                cls=TransferEncoder, ensure_ascii=False)
+
+
+@contextmanager
+def preserved_timestamps():
+    """Отключает auto_now и auto_now_add, чтобы сохранить даты из файла."""
+    fields = (
+        Post._meta.get_field('pub_date'),
+        Post._meta.get_field('modified'),
+        Comment._meta.get_field('created'),
+    )
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
@@ -13,6 +13,11 @@ urlpatterns = [
          views.group_posts,
          name='group_list'),
 
+    # Поиск по постам
+    path('search/',
+         views.search_posts,
+         name='search'),
+
     # Профайл пользователя
     path('profile/<str:username>/',
          views.profile,
@@ -33,11 +38,21 @@ urlpatterns = [
          views.post_edit,
          name='post_edit'),
 
+    # Выгрузка всех постов автора
+    path('profile/<str:username>/export/',
+         views.profile_export,
+         name='profile_export'),
+
     # Коментирование поста
     path('posts/<int:post_id>/comment/',
          views.add_comment,
          name='add_comment'),
 
+    # Следующие страницы комментариев
+    path('posts/<int:post_id>/comments/',
+         views.comment_list,
+         name='comment_list'),
+
     # Список подписок
     path('follow/', views.follow_index, name='follow_index'),
 
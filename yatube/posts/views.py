@@ -1,27 +1,59 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db import router, transaction
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.utils.http import urlencode
+from django.views.decorators.http import condition
 
-from core.utils import paginator
+from core.cache import generation_cache_page, generation_etag
+from core.replicas import pin_primary, read_replica
+from core.utils import CursorPaginator, paginator
 
+from . import archive, counters, exports, feed, generations, search
 from .forms import CommentForm, PostForm
-from .models import Comment, Follow, Group, Post
+from .models import Follow, Group, Post
 
 
-@cache_page(20, key_prefix='index_page')
+@read_replica
+@generation_cache_page(settings.PAGE_CACHE_TIMEOUT,
+                       generations.index_scopes)
 def index(request):
-    post_list = Post.objects.all()
-    page_obj = paginator(request, post_list)
+    post_list = Post.objects.feed()
+    page_obj = paginator(request, post_list, estimate_count=True)
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/index.html', context)
 
 
+@read_replica
+@generation_cache_page(settings.PAGE_CACHE_TIMEOUT,
+                       generations.index_scopes)
+def search_posts(request):
+    query = request.GET.get('q', '').strip()
+    posts = search.search(Post.objects.feed(), query)
+    # Выдача отсортирована по релевантности, поэтому страницы по номерам.
+    page_obj = Paginator(posts, settings.PAGE_SIZE).get_page(
+        request.GET.get('page'))
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'page_prefix': '?{}&'.format(urlencode({'q': query})),
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@read_replica
+@condition(etag_func=generation_etag(generations.group_page_scopes))
+@generation_cache_page(settings.PAGE_CACHE_TIMEOUT,
+                       generations.group_page_scopes)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    page_obj = paginator(request, group.posts.all())
+    page_obj = paginator(request, archive.post_sources(group=group),
+                         tiered=True)
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -29,39 +61,81 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@read_replica
+@condition(etag_func=generation_etag(generations.profile_page_scopes))
+@generation_cache_page(settings.PAGE_CACHE_TIMEOUT,
+                       generations.profile_page_scopes)
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
-    post_list = user.post_set.all()
-    page_obj = paginator(request, post_list)
-    following = False
-    if request.user.is_authenticated:
-        following = Follow.objects.filter(
-            user=request.user, author=user).exists()
-
+    user = get_object_or_404(User.objects.select_related('counters'),
+                             username=username)
+    page_obj = paginator(request, archive.post_sources(author=user),
+                         tiered=True)
+    user_counters = counters.for_user(user)
+    # Кнопка подписки зависит от посетителя и заполняется отдельно
+    # от общей страницы (см. posts/includes/follow_button.html).
     context = {
         'author': user,
         'page_obj': page_obj,
-        'post_count': user.post_set.count(),
-        'following': following,
+        'post_count': user_counters.post_count,
+        'counters': user_counters,
     }
     return render(request, 'posts/profile.html', context)
 
 
+@login_required
+@read_replica
+def profile_export(request, username):
+    # Выгрузить можно только свои посты.
+    if username != request.user.username:
+        return redirect('posts:profile', username=username)
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        raise Http404('Неизвестный формат')
+    content_type, lines = exports.FORMATS[fmt]
+    rows = exports.author_posts(request.user, router.db_for_read(Post))
+    response = StreamingHttpResponse(
+        lines(rows, request.build_absolute_uri), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="posts.{fmt}"'
+    return response
+
+
+@read_replica
+@condition(etag_func=generation_etag(generations.post_page_scopes))
 def post_detail(request, post_id: int):
-    post = get_object_or_404(Post, pk=post_id)
-    post_list = post.author.post_set.count()
-    comments = Comment.objects.filter(post=post)
+    post = archive.find_post(post_id)
     form = CommentForm()
     context = {
         'post': post,
-        'post_count': post_list,
-        'comments': comments,
+        'post_count': counters.for_user(post.author).post_count,
+        'comments': comment_page(post, None),
         'form': form,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def comment_page(post, cursor):
+    """Страница комментариев поста вместе с авторами одним запросом."""
+    comments = post.comments.select_related('author').only(
+        'text', 'created', 'post', 'author__username')
+    return CursorPaginator(comments, settings.COMMENTS_PAGE_SIZE,
+                           field='created').get_page(cursor)
+
+
+@read_replica
+@condition(etag_func=generation_etag(generations.post_page_scopes))
+def comment_list(request, post_id: int):
+    # Фрагмент, который страница поста подгружает по кнопке «Ещё».
+    post = archive.find_post(post_id)
+    context = {
+        'post': post,
+        'comments': comment_page(post, request.GET.get('cursor')),
+    }
+    return render(request, 'posts/includes/comment_list.html', context)
+
+
 @login_required
+@pin_primary
+@transaction.atomic
 def post_create(request):
     form = PostForm(request.POST or None,
                     files=request.FILES or None
@@ -77,6 +151,7 @@ def post_create(request):
 
 
 @login_required
+@pin_primary
 def post_edit(request, post_id: int):
     post = get_object_or_404(Post, id=post_id)
     if post.author != request.user:
@@ -96,6 +171,8 @@ def post_edit(request, post_id: int):
 
 
 @login_required
+@pin_primary
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     form = CommentForm(request.POST or None)
@@ -108,31 +185,43 @@ def add_comment(request, post_id):
 
 
 @login_required
+@read_replica
 def follow_index(request):
-    # Получение списка авторов, на которых подписан текущий пользователь
-    following = Follow.objects.filter(user=request.user).values_list('author',
-                                                                     flat=True)
-    # Получение списка постов от этих авторов
-    posts = Post.objects.filter(author__in=following)
-    context = {'posts': posts}
+    if 'cursor' not in request.GET:
+        # Подрезаем ленту при открытии её начала, а не на каждой странице.
+        feed.trim(request.user)
+    page_obj = paginator(request, feed.home_feed(request.user))
+    context = {
+        'page_obj': page_obj,
+        'follow': True,
+    }
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
+@pin_primary
+@transaction.atomic
 def profile_follow(request, username):
     # Получение объекта пользователя, на которого подписываемся
     author = get_object_or_404(User, username=username)
     # Проверка, что пользователь не подписывается на самого себя
     if request.user != author:
         # Создание объекта Follow
-        Follow.objects.get_or_create(user=request.user, author=author)
+        _, created = Follow.objects.get_or_create(user=request.user,
+                                                  author=author)
+        if created:
+            feed.promote_if_popular(author)
+            feed.backfill(request.user, author)
     return redirect('posts:profile', username=username)
 
 
 @login_required
+@pin_primary
+@transaction.atomic
 def profile_unfollow(request, username):
     # Получение объекта пользователя, от которого отписываемся
     author = get_object_or_404(User, username=username)
     # Удаление объекта Follow
     Follow.objects.filter(user=request.user, author=author).delete()
+    feed.drop_author(request.user, author)
     return redirect('posts:profile', username=username)
@@ -32,11 +32,27 @@ ALLOWED_HOSTS = [
     'testserver',
 ]
 
+# Общий для всех процессов сайта кеш задаётся переменными YATUBE_CACHE
+# (бэкенд, например django.core.cache.backends.memcached.MemcachedCache)
+# и YATUBE_CACHE_LOCATION. Без него у каждого процесса свой
+# LocMemCache: поколения страниц, граф подписок и список pull-авторов,
+# изменённые в одном процессе, другие не видят, поэтому всё это живёт
+# в кеше не дольше LOCAL_CACHE_TIMEOUT.
+SHARED_CACHE = bool(os.environ.get('YATUBE_CACHE'))
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': os.environ.get(
+            'YATUBE_CACHE', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('YATUBE_CACHE_LOCATION', ''),
     }
 }
+LOCAL_CACHE_TIMEOUT = (20)
+# Страницы кешируются по поколениям данных и при изменениях
+# не устаревают, поэтому в общем кеше могут храниться долго.
+PAGE_CACHE_TIMEOUT = 60 * 60 * 6 if SHARED_CACHE else LOCAL_CACHE_TIMEOUT
+# Карточка поста ключуется датой его изменения и поколением групп.
+POST_CARD_CACHE_TIMEOUT = (60 * 60 * 24 if SHARED_CACHE
+                           else LOCAL_CACHE_TIMEOUT)
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
@@ -57,6 +73,7 @@ INSTALLED_APPS = [
     'posts.apps.PostsConfig',
     'core.apps.CoreConfig',
     'about.apps.AboutConfig',
+    'api.apps.ApiConfig',
     'sorl.thumbnail',
 ]
 
@@ -149,18 +166,77 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
 # Добавили базу данных.
+# core.backends.sqlite3 включает WAL и прагмы из OPTIONS['pragmas'],
+# см. DEFAULT_PRAGMAS; CONN_MAX_AGE оставляет соединение открытым
+# между запросами.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 60,
+        'OPTIONS': {
+            'pragmas': {
+                'synchronous': 'normal',
+                'busy_timeout': 5000,
+            },
+        },
     }
 }
+# Реплики только для чтения. Локально их изображают файлы SQLite из
+# YATUBE_REPLICAS (через запятую), копию базы в них снимает команда
+# sync_replicas.
+for number, name in enumerate(
+        filter(None, os.environ.get('YATUBE_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'core.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, name),
+        'CONN_MAX_AGE': 60,
+        'TEST': {'MIRROR': 'default'},
+    }
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+# Сколько секунд после записи пользователь читает с основной базы.
+REPLICA_PIN_SECONDS = 10
 
 PAGE_SIZE = (10)
+# Комментарии под постом подгружаются страницами такого размера.
+COMMENTS_PAGE_SIZE = (20)
+# С какого числа постов пагинатор перестаёт считать их точно.
+ESTIMATED_COUNT_THRESHOLD = (10000)
+ESTIMATED_COUNT_TIMEOUT = 60 * 5
 POST_TEST_COUNT = (13)
 COUNT_TEXT = (15)
 CHARACTER_LIMIT_IN_TITLE = (30)
 
+# Сколько последних постов хранится в ленте подписок пользователя.
+TIMELINE_SIZE = (500)
+FAN_OUT_BATCH_SIZE = (1000)
+# Начиная с этого числа подписчиков посты автора не раскладываются
+# по лентам, а подмешиваются при чтении.
+FEED_PULL_THRESHOLD = (10000)
+# Сколько секунд список pull-авторов живёт в кеше.
+PULL_AUTHORS_TIMEOUT = (60)
+# Сколько секунд граф подписок пользователя живёт в кеше.
+FOLLOW_GRAPH_TIMEOUT = 60 * 60 if SHARED_CACHE else LOCAL_CACHE_TIMEOUT
+# Порция строк, которую выгрузка постов автора читает из базы за раз.
+EXPORT_CHUNK_SIZE = (2000)
+# Посты старше этого числа дней archive_posts переносит в архив.
+ARCHIVE_AFTER_DAYS = (365)
+# Ограничения и обработка загружаемых картинок (posts/images.py).
+IMAGE_MAX_BYTES = 10 * 1024 * 1024
+IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+IMAGE_MAX_SIDE = (1920)
+IMAGE_QUALITY = (82)
+FILE_UPLOAD_HANDLERS = [
+    'posts.images.LimitedUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+# Потоки, в которых строятся миниатюры новых картинок; 0 — не строить
+# заранее.
+THUMBNAIL_WORKERS = (2)
+THUMBNAIL_KVSTORE = 'core.kvstore.KVStore'
+
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 # DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 